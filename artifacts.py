@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+
+# Content-addressed store for generated project artifacts.
+# Every generated file is kept once under artifacts/blobs/, named by the hash of its bytes.
+# A separate index maps a request key -- hash of (model, normalized prompt, path role) --
+# to the blob it produced, so an identical request can reuse the blob instead of calling the model.
+
+ARTIFACTS_DIR = "artifacts"
+BLOBS_DIR = os.path.join(ARTIFACTS_DIR, "blobs")
+INDEX_PATH = os.path.join(ARTIFACTS_DIR, "index.json")
+
+os.makedirs(BLOBS_DIR, exist_ok=True)
+
+# Reuse policies:
+#   "off"         - always call the model (outputs are not stored).
+#   "boilerplate" - reuse only well-known boilerplate files and logos.
+#   "all"         - reuse any artifact whose (model, prompt, role) has been seen before.
+ARTIFACT_REUSE_POLICY = os.getenv("ARTIFACT_REUSE_POLICY", "boilerplate")
+
+# How a reused blob is placed into a project: "hardlink" (falls back to copy) or "copy".
+ARTIFACT_LINK_MODE = os.getenv("ARTIFACT_LINK_MODE", "hardlink")
+
+BOILERPLATE_ROLES = {
+    "readme", "readme.md", "readme.txt", "license", "license.md", ".gitignore",
+    "requirements.txt", "package.json", "pyproject.toml", "setup.py", "dockerfile",
+    "index.html", "style.css", "styles.css", "logo",
+}
+
+# Process-wide totals, in addition to the per-build stats kept on each task.
+stats = {"model_calls": 0, "model_calls_saved": 0, "bytes_saved": 0}
+
+_index = None
+
+
+def _load_index() -> dict:
+    global _index
+    if _index is None:
+        try:
+            with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+                _index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _index = {}
+    return _index
+
+def _save_index():
+    tmp_path = f"{INDEX_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_index, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercases a prompt and collapses whitespace so trivially different prompts share a key."""
+    return re.sub(r"\s+", " ", (prompt or "").strip().lower())
+
+def path_role(path: str) -> str:
+    """Returns the role of a project path, i.e. its lowercased file name ("README.md" -> "readme.md")."""
+    return os.path.basename((path or "").rstrip("/")).lower()
+
+def artifact_key(model: str, prompt: str, role: str) -> str:
+    """Hashes (model, normalized prompt, path role) into a request key."""
+    payload = json.dumps([model, normalize_prompt(prompt), role])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def reuse_allowed(role: str) -> bool:
+    """Whether the configured policy allows reusing an artifact with this role."""
+    if ARTIFACT_REUSE_POLICY == "all":
+        return True
+    if ARTIFACT_REUSE_POLICY == "boilerplate":
+        return role in BOILERPLATE_ROLES
+    return False
+
+def lookup(key: str) -> str | None:
+    """Returns the blob path previously stored for a request key, if it still exists."""
+    blob_path = _load_index().get(key)
+    if blob_path and os.path.exists(blob_path):
+        return blob_path
+    return None
+
+def store_file(key: str, src_path: str) -> str | None:
+    """
+    Adds a generated file to the store under its content hash and records it for `key`.
+    Returns the blob path, or None when the reuse policy is "off".
+    """
+    if ARTIFACT_REUSE_POLICY == "off":
+        return None
+
+    digest = hashlib.sha256()
+    with open(src_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    _, ext = os.path.splitext(src_path)
+    blob_dir = os.path.join(BLOBS_DIR, content_hash[:2])
+    blob_path = os.path.join(blob_dir, f"{content_hash}{ext.lower()}")
+    if not os.path.exists(blob_path):
+        os.makedirs(blob_dir, exist_ok=True)
+        shutil.copy2(src_path, blob_path)
+
+    _load_index()[key] = blob_path
+    _save_index()
+    return blob_path
+
+def materialize(blob_path: str, dest_path: str) -> int:
+    """Places a stored blob at `dest_path` (hardlink or copy) and returns its size in bytes."""
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+
+    if ARTIFACT_LINK_MODE == "hardlink":
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copy2(blob_path, dest_path)
+    else:
+        shutil.copy2(blob_path, dest_path)
+    return os.path.getsize(dest_path)
+
+def record(build_stats: dict, reused: bool, nbytes: int = 0):
+    """Counts a model call (or a saved one) in a build's stats and in the process totals."""
+    for target in (build_stats, stats):
+        if reused:
+            target["model_calls_saved"] = target.get("model_calls_saved", 0) + 1
+            target["bytes_saved"] = target.get("bytes_saved", 0) + nbytes
+        else:
+            target["model_calls"] = target.get("model_calls", 0) + 1
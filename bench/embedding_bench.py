@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+# Memory and throughput of consensus embeddings with N server workers, in-process vs sidecar.
+# Each worker is a separate interpreter that imports consensus like a uvicorn worker does and
+# calls encode_outputs() in a loop with the two answers of a typical prompt. In sidecar mode
+# one embedding_service.py process serves all of them. Reports the summed resident memory of
+# every process involved (Linux /proc) and the combined encode throughput.
+#
+#   python bench/embedding_bench.py --workers 1 4 8 --duration 20
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_ANSWERS = [
+    "Quantum computers use qubits, which can be 0 and 1 at the same time, so they explore many possibilities at once.",
+    "A quantum computer stores information in qubits that can be in a superposition of states.",
+    "The Amazon river carries more water than any other river on Earth.",
+    "Canberra was chosen as Australia's capital as a compromise between Sydney and Melbourne.",
+    "Hamlet seeks revenge on his uncle Claudius, who murdered his father to take the throne.",
+    "Go compiles to a single static binary and has cheap goroutines; Python has a larger ecosystem.",
+]
+
+
+def rss_kb(pid: int | str = "self", field: str = "VmRSS") -> int:
+    """Resident memory of a process in kB (VmHWM for the peak)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# --- Worker ---
+
+async def run_worker(args) -> dict:
+    sys.path.insert(0, REPO_ROOT)
+    import consensus
+
+    await consensus.encode_outputs(SAMPLE_ANSWERS[:2])  # Load the model / open the connection.
+    await asyncio.sleep(max(0.0, args.start_at - time.time()))
+
+    latencies, texts = [], 0
+    deadline = time.time() + args.duration
+
+    async def loop():
+        nonlocal texts
+        while time.time() < deadline:
+            outputs = random.sample(SAMPLE_ANSWERS, 2)
+            started = time.perf_counter()
+            await consensus.encode_outputs(outputs)
+            latencies.append(time.perf_counter() - started)
+            texts += len(outputs)
+
+    await asyncio.gather(*(loop() for _ in range(args.concurrency)))
+    return {"texts": texts, "calls": len(latencies), "latencies": latencies,
+            "rss_kb": rss_kb(), "peak_rss_kb": rss_kb(field="VmHWM")}
+
+
+# --- Driver ---
+
+def start_sidecar(socket_path: str) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "embedding_service.py"), "--socket", socket_path],
+                               cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    # The socket appears only once the model is loaded.
+    for _ in range(1200):
+        if os.path.exists(socket_path):
+            return process
+        if process.poll() is not None:
+            raise RuntimeError("embedding_service.py exited during startup")
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("embedding_service.py did not start within 120s")
+
+def run_configuration(mode: str, workers: int, args) -> dict:
+    socket_path = os.path.join(tempfile.gettempdir(), f"tiwa-embed-bench-{os.getpid()}.sock")
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+           "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY", "bench")}
+    env.pop("EMBEDDING_SOCKET", None)
+    sidecar = None
+    if mode == "sidecar":
+        sidecar = start_sidecar(socket_path)
+        # No silent fallback: a worker that cannot reach the sidecar should fail the run.
+        env.update(EMBEDDING_SOCKET=socket_path, EMBEDDING_FALLBACK="0")
+
+    try:
+        # Workers load in parallel and start the measured window together.
+        start_at = time.time() + args.startup_seconds
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker",
+                                       "--duration", str(args.duration), "--concurrency", str(args.concurrency),
+                                       "--start-at", str(start_at)],
+                                      cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True)
+                     for _ in range(workers)]
+        results = []
+        for process in processes:
+            out, _ = process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"{mode} worker exited with {process.returncode}")
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        sidecar_kb = rss_kb(sidecar.pid) if sidecar else 0
+        sidecar_peak_kb = rss_kb(sidecar.pid, "VmHWM") if sidecar else 0
+    finally:
+        if sidecar:
+            sidecar.terminate()
+            sidecar.wait()
+
+    latencies = [value for result in results for value in result["latencies"]]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "texts_per_s": round(sum(r["texts"] for r in results) / args.duration, 1),
+        "calls": len(latencies),
+        "latency_ms": {p: round(percentile(latencies, f) * 1000, 1) for p, f in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "rss_mb": round((sum(r["rss_kb"] for r in results) + sidecar_kb) / 1024, 1),
+        "peak_rss_mb": round((sum(r["peak_rss_kb"] for r in results) + sidecar_peak_kb) / 1024, 1),
+        "sidecar_rss_mb": round(sidecar_kb / 1024, 1),
+    }
+
+def print_table(rows: list):
+    print(f"{'mode':<11} {'workers':>7} {'texts/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'peak MB':>8} {'sidecar MB':>10}")
+    for row in rows:
+        print(f"{row['mode']:<11} {row['workers']:>7} {row['texts_per_s']:>9} {row['latency_ms']['p50']:>8} "
+              f"{row['latency_ms']['p95']:>8} {row['rss_mb']:>8} {row['peak_rss_mb']:>8} {row['sidecar_rss_mb']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and sidecar embeddings across worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--modes", nargs="+", default=["in_process", "sidecar"], choices=["in_process", "sidecar"])
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per configuration.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent encode calls per worker.")
+    parser.add_argument("--startup-seconds", type=float, default=60.0, help="Time allowed for workers to load.")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(args))))
+        return
+
+    rows = [run_configuration(mode, workers, args) for workers in args.workers for mode in args.modes]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+# Import-time profile of the server, for tracking startup regressions.
+# Runs `python -X importtime -c "import server"` in a fresh interpreter and reports the
+# total import time, the slowest top-level imports, and any heavy SDK that is imported
+# eagerly even though it should load on first use.
+#
+#   python bench/import_profile.py                 # report
+#   python bench/import_profile.py --budget-ms 2500 # also exit 1 when over budget
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be on the startup path; they are loaded lazily or by warmup.
+LAZY_MODULES = ["google.generativeai", "sentence_transformers", "torch", "replicate", "tavily", "pypdf", "bs4"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def profile(module: str) -> list:
+    """Returns [(module, self_us, cumulative_us, depth)] in import order."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # Placeholder keys let client constructors run; nothing is sent anywhere.
+    env.setdefault("OPENAI_API_KEY", "import-profile")
+    env.setdefault("DEEPSEEK_API_KEY", "import-profile")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+def build_report(module: str, rows: list, top: int) -> dict:
+    total = next((row[2] for row in rows if row[0] == module and row[3] == 0), 0)
+    # The profiled module's own imports and theirs; deeper levels are folded into these.
+    candidates = [row for row in rows if row[3] in (1, 2)]
+    imported = {row[0] for row in rows}
+    return {
+        "total_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "slowest": [{"module": name, "depth": depth, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(own / 1000, 1)}
+                    for name, own, cumulative, depth in sorted(candidates, key=lambda r: -r[2])[:top]],
+        "eager_heavy_modules": [name for name in LAZY_MODULES if name in imported],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the server module.")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, help="Exit 1 if the total import time exceeds this.")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = build_report(args.module, profile(args.module), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: {report['total_ms']} ms across {report['modules']} modules\n")
+        print(f"{'module':<40} {'cumulative ms':>14} {'self ms':>9}")
+        for row in report["slowest"]:
+            name = ("  " * (row["depth"] - 1) + row["module"])[:40]
+            print(f"{name:<40} {row['cumulative_ms']:>14} {row['self_ms']:>9}")
+        if report["eager_heavy_modules"]:
+            print(f"\nImported eagerly (should be lazy): {', '.join(report['eager_heavy_modules'])}")
+
+    over_budget = args.budget_ms is not None and report["total_ms"] > args.budget_ms
+    if over_budget:
+        print(f"\nOver budget: {report['total_ms']} ms > {args.budget_ms} ms", file=sys.stderr)
+    return 1 if over_budget or report["eager_heavy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
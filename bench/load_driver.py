@@ -0,0 +1,189 @@
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+import httpx
+import websockets
+
+# Load driver for the /ws/{client_id} pipeline.
+# Opens many concurrent WebSocket clients, replays a prompt mix, and reports throughput,
+# time to first frame (`thinking`), time to final frame (`final`/`error`), and event-loop
+# lag both in the server (from /metrics) and in the driver itself (to rule it out).
+#
+#   python bench/load_driver.py --url http://127.0.0.1:3000 --clients 50 --prompts 10
+
+DEFAULT_PROMPTS = [
+    "Explain quantum computing like I'm 10",
+    "What is the capital of Australia and why was it chosen?",
+    "Summarize the plot of Hamlet in three sentences.",
+    "Search the web for today's technology news.",
+    "Write a haiku about distributed systems.",
+    "Compare Python and Go for backend services.",
+]
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def load_prompt_mix(path: str | None) -> list:
+    """One prompt per line, or JSON lines with a "prompt" key. Defaults to a built-in mix."""
+    if not path:
+        return DEFAULT_PROMPTS
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                prompts.append(json.loads(line)["prompt"] if line.startswith("{") else line)
+    return prompts
+
+
+# --- Server Metrics ---
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+
+async def scrape_loop_lag(client: httpx.AsyncClient, base_url: str) -> dict | None:
+    """Returns the server's event-loop lag histogram buckets ({le: count}) from /metrics."""
+    try:
+        response = await client.get(f"{base_url}/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    buckets = {}
+    for line in response.text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and match.group(1) == "tiwa_event_loop_lag_seconds_bucket":
+            le = re.search(r'le="([^"]+)"', match.group(2)).group(1)
+            buckets[float(le)] = float(match.group(3))
+    return buckets
+
+def lag_percentiles(before: dict, after: dict) -> dict:
+    """Approximates lag percentiles (bucket upper bounds) from two cumulative histogram scrapes."""
+    bounds = sorted(after)
+    delta = [after[b] - before.get(b, 0) for b in bounds]
+    total = delta[-1] if delta else 0
+    result = {"samples": int(total)}
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        result[name] = next((b for b, count in zip(bounds, delta) if total and count >= fraction * total), float("nan"))
+    return result
+
+async def monitor_driver_lag(samples: list, interval: float = 0.1):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+# --- Clients ---
+
+async def run_client(index: int, args, prompts: list, results: list):
+    ws_url = args.url.replace("http", "ws", 1) + f"/ws/bench-{index}-{uuid.uuid4().hex[:6]}"
+    async with websockets.connect(ws_url, max_size=None, open_timeout=30) as ws:
+        for _ in range(args.prompts):
+            prompt_id = uuid.uuid4().hex
+            sent = time.perf_counter()
+            record = {"client": index, "first_frame": None, "final": None, "outcome": "timeout"}
+            await ws.send(json.dumps({"action": "message", "prompt": random.choice(prompts), "prompt_id": prompt_id}))
+
+            async def wait_for_final():
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if frame.get("prompt_id") != prompt_id:
+                        continue  # Progress frames and leftovers from timed-out prompts.
+                    if record["first_frame"] is None:
+                        record["first_frame"] = time.perf_counter() - sent
+                    if frame["type"] in ("final", "error"):
+                        record["final"] = time.perf_counter() - sent
+                        record["outcome"] = frame["type"]
+                        return
+
+            try:
+                await asyncio.wait_for(wait_for_final(), args.timeout)
+            except asyncio.TimeoutError:
+                pass
+            results.append(record)
+            if args.think_time:
+                await asyncio.sleep(random.uniform(0, 2 * args.think_time))
+
+async def run(args) -> dict:
+    prompts = load_prompt_mix(args.prompt_file)
+    results, driver_lag = [], []
+    lag_task = asyncio.create_task(monitor_driver_lag(driver_lag))
+
+    async with httpx.AsyncClient(timeout=10) as http:
+        lag_before = await scrape_loop_lag(http, args.url)
+        started = time.perf_counter()
+
+        async def staggered(index):
+            await asyncio.sleep(index * args.ramp / max(1, args.clients))
+            try:
+                await run_client(index, args, prompts, results)
+            except Exception as e:
+                print(f"client {index} failed: {e!r}", file=sys.stderr)
+
+        await asyncio.gather(*(staggered(i) for i in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        lag_after = await scrape_loop_lag(http, args.url)
+    lag_task.cancel()
+
+    first = [r["first_frame"] for r in results if r["first_frame"] is not None]
+    final = [r["final"] for r in results if r["outcome"] == "final"]
+    report = {
+        "clients": args.clients,
+        "prompts": len(results),
+        "completed": len(final),
+        "errors": sum(1 for r in results if r["outcome"] == "error"),
+        "timeouts": sum(1 for r in results if r["outcome"] == "timeout"),
+        "seconds": round(elapsed, 2),
+        "throughput_per_s": round(len(final) / elapsed, 2) if elapsed else 0.0,
+        "time_to_first_frame_ms": {p: round(percentile(first, f) * 1000, 1) for p, f in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "time_to_final_ms": {p: round(percentile(final, f) * 1000, 1) for p, f in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "driver_loop_lag_ms": {"p99": round(percentile(driver_lag, .99) * 1000, 1), "max": round(max(driver_lag, default=0) * 1000, 1)},
+    }
+    if lag_before is not None and lag_after:
+        server_lag = lag_percentiles(lag_before, lag_after)
+        report["server_loop_lag_ms"] = {k: (v * 1000 if k != "samples" else v) for k, v in server_lag.items()}
+    return report
+
+def print_report(report: dict):
+    print(f"{report['prompts']} prompts from {report['clients']} clients in {report['seconds']}s "
+          f"({report['completed']} final, {report['errors']} errors, {report['timeouts']} timeouts)")
+    print(f"throughput: {report['throughput_per_s']} prompts/s")
+    for key in ("time_to_first_frame_ms", "time_to_final_ms"):
+        values = report[key]
+        print(f"{key:<24} p50 {values['p50']:>9} p95 {values['p95']:>9} p99 {values['p99']:>9}")
+    if "server_loop_lag_ms" in report:
+        lag = report["server_loop_lag_ms"]
+        print(f"server loop lag (<= ms)  p50 {lag['p50']:>9} p95 {lag['p95']:>9} p99 {lag['p99']:>9}  ({lag['samples']} samples)")
+    print(f"driver loop lag ms       p99 {report['driver_loop_lag_ms']['p99']:>9} max {report['driver_loop_lag_ms']['max']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent WebSocket load test for the TIWA server.")
+    parser.add_argument("--url", default="http://127.0.0.1:3000", help="Server base URL.")
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent WebSocket clients.")
+    parser.add_argument("--prompts", type=int, default=5, help="Prompts sent by each client, one at a time.")
+    parser.add_argument("--prompt-file", help="Prompt mix: one prompt per line or JSON lines with a 'prompt' key.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a client's prompts (s).")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which clients connect.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-prompt timeout (s).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
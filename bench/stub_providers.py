@@ -0,0 +1,268 @@
+import json
+import time
+import uuid
+import zlib
+import struct
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Local stand-ins for every upstream API the server calls, for load tests that cost nothing.
+# One process serves all providers under separate prefixes so each can get its own
+# latency and error rate:
+#
+#   OPENAI_BASE_URL=http://127.0.0.1:9100/openai/v1       (GPT chat + DALL-E images)
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:9100/deepseek/v1
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:9100/gemini      (decider + judge, REST transport)
+#   TAVILY_BASE_URL=http://127.0.0.1:9100/tavily
+#   REPLICATE_BASE_URL=http://127.0.0.1:9100/replicate
+#
+# Run with: python bench/stub_providers.py --port 9100 --openai-latency-ms 900 --error-rate 0.01
+
+PROVIDERS = ("openai", "deepseek", "gemini", "tavily", "replicate")
+
+config = {
+    "latency_ms": {"openai": 800, "deepseek": 1200, "gemini": 400, "tavily": 600, "replicate": 3000},
+    "error_rate": {name: 0.0 for name in PROVIDERS},
+    "jitter": 0.3,            # Relative standard deviation of latencies.
+    "stream_tokens": 40,      # Chunks per streamed chat completion.
+    "tool_call_rate": 0.2,    # Fraction of decider calls that answer with a function call.
+    "disagree_rate": 0.3,     # Fraction of DeepSeek answers unrelated to GPT's (forces the judge).
+    "file_bytes": 512 * 1024,  # Size of generated video/audio downloads.
+}
+
+stats = {name: {"requests": 0, "errors": 0} for name in PROVIDERS}
+
+ANSWER = ("Quantum computers use qubits, which can be 0 and 1 at the same time, so they can explore "
+          "many possibilities at once and solve certain problems much faster than ordinary computers.")
+OTHER_ANSWER = ("The Amazon river carries more water than any other river on Earth and drains a basin "
+                "that covers much of South America.")
+
+app = FastAPI()
+
+_predictions: dict = {}  # id -> {"created": float, "input": dict, "version": str, "canceled": bool}
+
+
+def _png(width: int = 64, height: int = 64) -> bytes:
+    """A small valid RGB PNG, so image variant generation has real input."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    # Each row is a filter byte followed by RGB pixels (a simple gradient).
+    raw = b"".join(b"\x00" + b"".join(bytes((x * 4 % 256, y * 4 % 256, 128)) for x in range(width)) for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+PNG_BYTES = _png()
+
+
+async def _simulate(provider: str) -> Response | None:
+    """Sleeps for the provider's latency; returns an error response for injected failures."""
+    stats[provider]["requests"] += 1
+    mean = config["latency_ms"][provider] / 1000
+    await asyncio.sleep(max(0.0, random.gauss(mean, mean * config["jitter"])))
+    if random.random() < config["error_rate"][provider]:
+        stats[provider]["errors"] += 1
+        return JSONResponse(status_code=503, content={"error": {"message": f"Injected {provider} failure", "code": 503}})
+    return None
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# --- OpenAI-compatible (GPT, DeepSeek, DALL-E) ---
+
+async def _chat_completion(provider: str, request: Request):
+    body = await request.json()
+    prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+    answer = OTHER_ANSWER if provider == "deepseek" and random.random() < config["disagree_rate"] else ANSWER
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if body.get("stream"):
+        stats[provider]["requests"] += 1
+        words = answer.split(" ")
+        step = max(1, len(words) // config["stream_tokens"])
+        mean = config["latency_ms"][provider] / 1000
+
+        async def events():
+            # Time to first token is a third of the latency; the rest is spread over the chunks.
+            await asyncio.sleep(mean / 3)
+            chunks = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+            for piece in chunks:
+                delta = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": body.get("model"), "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+                await asyncio.sleep(mean * 2 / 3 / len(chunks))
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model"), "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    error = await _simulate(provider)
+    if error:
+        return error
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(answer),
+                  "total_tokens": _tokens(prompt) + _tokens(answer)},
+    }
+
+@app.post("/openai/v1/chat/completions")
+async def openai_chat(request: Request):
+    return await _chat_completion("openai", request)
+
+@app.post("/deepseek/v1/chat/completions")
+async def deepseek_chat(request: Request):
+    return await _chat_completion("deepseek", request)
+
+@app.post("/openai/v1/images/generations")
+async def openai_images(request: Request):
+    error = await _simulate("openai")
+    if error:
+        return error
+    return {"created": int(time.time()), "data": [{"url": f"{request.base_url}files/{uuid.uuid4()}.png"}]}
+
+
+# --- Gemini (REST transport) ---
+
+@app.post("/gemini/v1beta/models/{model_method}")
+async def gemini_generate(model_method: str, request: Request):
+    body = await request.json()
+    error = await _simulate("gemini")
+    if error:
+        return error
+    text = " ".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+
+    # Requests that declare tools come from the decider; some of them get a function call back.
+    if body.get("tools") and random.random() < config["tool_call_rate"]:
+        part = {"functionCall": {"name": "tavily_web_search", "args": {"query": text[-80:] or "news"}}}
+    else:
+        part = {"text": ANSWER}
+    return {
+        "candidates": [{"content": {"parts": [part], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": _tokens(text), "candidatesTokenCount": _tokens(ANSWER),
+                          "totalTokenCount": _tokens(text) + _tokens(ANSWER)},
+    }
+
+
+# --- Tavily ---
+
+@app.post("/tavily/search")
+async def tavily_search(request: Request):
+    body = await request.json()
+    error = await _simulate("tavily")
+    if error:
+        return error
+    results = [{"title": f"Result {i + 1}", "url": f"https://example.com/{i + 1}", "content": ANSWER, "score": 0.9 - i * 0.1}
+               for i in range(5)]
+    return {"query": body.get("query"), "results": results, "response_time": config["latency_ms"]["tavily"] / 1000}
+
+
+# --- Replicate ---
+
+def _prediction(prediction_id: str, request: Request) -> dict:
+    record = _predictions[prediction_id]
+    elapsed_ms = (time.time() - record["created"]) * 1000
+    if record["canceled"]:
+        status = "canceled"
+    elif record["failed"]:
+        status = "failed"
+    elif elapsed_ms >= record["latency_ms"]:
+        status = "succeeded"
+    else:
+        status = "processing"
+    extension = ".wav" if "duration" in record["input"] else ".mp4"
+    return {
+        "id": prediction_id,
+        "model": "stub/model",
+        "version": record["version"],
+        "status": status,
+        "input": record["input"],
+        "output": f"{request.base_url}files/{prediction_id}{extension}" if status == "succeeded" else None,
+        "logs": "",
+        "error": "Injected replicate failure" if status == "failed" else None,
+        "metrics": {},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(record["created"])),
+        "started_at": None,
+        "completed_at": None,
+        "urls": {"get": f"{request.base_url}replicate/v1/predictions/{prediction_id}",
+                 "cancel": f"{request.base_url}replicate/v1/predictions/{prediction_id}/cancel"},
+    }
+
+@app.post("/replicate/v1/predictions")
+async def replicate_create(request: Request):
+    body = await request.json()
+    stats["replicate"]["requests"] += 1
+    prediction_id = uuid.uuid4().hex
+    mean = config["latency_ms"]["replicate"]
+    failed = random.random() < config["error_rate"]["replicate"]
+    if failed:
+        stats["replicate"]["errors"] += 1
+    _predictions[prediction_id] = {
+        "created": time.time(), "input": body.get("input", {}), "version": body.get("version", ""),
+        "canceled": False, "failed": failed, "latency_ms": max(0.0, random.gauss(mean, mean * config["jitter"])),
+    }
+    return JSONResponse(status_code=201, content=_prediction(prediction_id, request))
+
+@app.get("/replicate/v1/predictions/{prediction_id}")
+async def replicate_get(prediction_id: str, request: Request):
+    if prediction_id not in _predictions:
+        return JSONResponse(status_code=404, content={"detail": "Not found."})
+    return _prediction(prediction_id, request)
+
+@app.post("/replicate/v1/predictions/{prediction_id}/cancel")
+async def replicate_cancel(prediction_id: str, request: Request):
+    if prediction_id not in _predictions:
+        return JSONResponse(status_code=404, content={"detail": "Not found."})
+    _predictions[prediction_id]["canceled"] = True
+    return _prediction(prediction_id, request)
+
+
+# --- Generated Files ---
+
+@app.api_route("/files/{name}", methods=["GET", "HEAD"])
+async def generated_file(name: str):
+    if name.endswith(".png"):
+        return Response(PNG_BYTES, media_type="image/png")
+    media_type = "audio/wav" if name.endswith(".wav") else "video/mp4"
+    return Response(b"\x00" * config["file_bytes"], media_type=media_type)
+
+@app.get("/stats")
+async def get_stats():
+    return {"config": config, "stats": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-ins for OpenAI, DeepSeek, Gemini, Tavily and Replicate.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--error-rate", type=float, help="Failure rate for every provider.")
+    for name in PROVIDERS:
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=config["latency_ms"][name])
+        parser.add_argument(f"--{name}-error-rate", type=float)
+    parser.add_argument("--jitter", type=float, default=config["jitter"])
+    parser.add_argument("--stream-tokens", type=int, default=config["stream_tokens"])
+    parser.add_argument("--tool-call-rate", type=float, default=config["tool_call_rate"])
+    parser.add_argument("--disagree-rate", type=float, default=config["disagree_rate"])
+    parser.add_argument("--file-bytes", type=int, default=config["file_bytes"])
+    args = parser.parse_args()
+
+    for name in PROVIDERS:
+        config["latency_ms"][name] = getattr(args, f"{name}_latency_ms")
+        rate = getattr(args, f"{name}_error_rate")
+        config["error_rate"][name] = rate if rate is not None else (args.error_rate or 0.0)
+    for key in ("jitter", "stream_tokens", "tool_call_rate", "disagree_rate", "file_bytes"):
+        config[key] = getattr(args, key)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,11 @@ def get_chat_session(chat_id: str) -> Dict:
     """Retrieves a chat session."""
     return chat_sessions.get(chat_id, None)
 
-def create_chat_session(chat_id: str):
-    """Creates a new chat session."""
+def create_chat_session(chat_id: str, client_id: str = None):
+    """Creates a new chat session owned by `client_id`."""
     if chat_id not in chat_sessions:
         chat_sessions[chat_id] = {
+            "client_id": client_id,
             "messages": [],
             "chain_of_thought": []
         }
@@ -1,48 +1,80 @@
 import asyncio
+import threading
 from models import call_gemini_judge
-from sentence_transformers import SentenceTransformer, util
+import metrics
+import embedding_service
 
-# Load sentence embedding model once globally
-similarity_model = SentenceTransformer("all-MiniLM-L6-v2")
+# The sentence embedding model (and torch) is loaded once, on first use, in a worker thread.
+SIMILARITY_MODEL_NAME = "all-MiniLM-L6-v2"
+_similarity_model = None
+_similarity_lock = threading.Lock()
+
+def get_similarity_model():
+    """Returns the shared SentenceTransformer, loading it on first call. Blocking."""
+    global _similarity_model
+    with _similarity_lock:
+        if _similarity_model is None:
+            from sentence_transformers import SentenceTransformer
+            _similarity_model = SentenceTransformer(SIMILARITY_MODEL_NAME)
+    return _similarity_model
+
+def _encode(outputs):
+    return get_similarity_model().encode(outputs, convert_to_numpy=True)
 
 async def encode_outputs(outputs):
-    """Asynchronously encode outputs into embeddings."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, similarity_model.encode, outputs, True)
+    """Asynchronously encode outputs into embeddings, on the shared sidecar when EMBEDDING_SOCKET is set."""
+    with metrics.stage("encode_outputs", texts=len(outputs), chars=sum(len(o) for o in outputs)) as span:
+        if embedding_service.EMBEDDING_SOCKET:
+            try:
+                embeddings = await embedding_service.encode(outputs)
+                span.set(mode="sidecar")
+                return embeddings
+            except (embedding_service.EmbeddingServiceError, asyncio.TimeoutError) as e:
+                if not embedding_service.EMBEDDING_FALLBACK:
+                    raise
+                embedding_service.stats["fallbacks"] += 1
+                print(f"Embedding service unavailable ({e}); encoding in-process.", flush=True)
+        span.set(mode="in_process")
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, _encode, outputs)
 
 async def compute_consensus(outputs: dict):
     """Compute semantic consensus asynchronously."""
+    import numpy as np
     model_outputs = list(outputs.values())
     model_names = list(outputs.keys())
 
     # Encode asynchronously
-    embeddings = await encode_outputs(model_outputs)
-    sim_matrix = util.pytorch_cos_sim(embeddings, embeddings)
+    embeddings = np.asarray(await encode_outputs(model_outputs), dtype=np.float32)
+    # Cosine similarity in numpy, so workers using the sidecar never need torch.
+    normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    sim_matrix = normalized @ normalized.T
 
     # Find the most semantically central output
-    avg_sims = sim_matrix.mean(dim=1)
-    top_idx = avg_sims.argmax().item()
+    avg_sims = sim_matrix.mean(axis=1)
+    top_idx = int(avg_sims.argmax())
 
     return {
         "output": model_outputs[top_idx],
-        "confidence": avg_sims[top_idx].item(),
+        "confidence": float(avg_sims[top_idx]),
         "source_model": model_names[top_idx]
     }
 
-async def verify_and_merge(outputs: dict, evidence: list, prompt: str) -> dict:
+async def verify_and_merge(outputs: dict, evidence: list, prompt: str, use_judge: bool = True) -> dict:
     """
     Async-parallel TIWA consensus engine:
     - Computes semantic agreement across multiple models.
     - If confidence < threshold, invokes Gemini Judge concurrently.
+    - With use_judge=False (overload), the most central output is returned as is.
     """
     consensus_task = asyncio.create_task(compute_consensus(outputs))
     consensus = await consensus_task
 
-    if consensus["confidence"] >= 0.85:
-        # Consensus strong enough, no need for arbitration
+    if consensus["confidence"] >= 0.85 or not use_judge:
+        # Consensus strong enough (or the judge is shed under load), no arbitration
         return {
             "final_output": consensus["output"],
-            "consensus_method": "semantic_agreement",
+            "consensus_method": "semantic_agreement" if consensus["confidence"] >= 0.85 else "semantic_best_effort",
             "confidence": consensus["confidence"],
             "source_model": consensus["source_model"]
         }
@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import httpx
+
+import tracing
+
+# Async downloader for generated media (Replicate outputs, DALL-E images).
+# All downloads share one connection pool, write in large buffered blocks from worker
+# threads, resume interrupted transfers with HTTP Range requests, and split large files
+# into parallel range segments when the server supports it. Within one download, a transport
+# error is retried up to DOWNLOAD_RETRIES times with a Range request from the last flushed
+# byte; a download that still fails removes its `.part` file.
+
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", str(1024 * 1024)))
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "4"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+# Files at least this large are fetched as PARALLEL_SEGMENTS concurrent ranges.
+PARALLEL_SEGMENT_THRESHOLD = int(os.getenv("PARALLEL_SEGMENT_THRESHOLD", str(16 * 1024 * 1024)))
+PARALLEL_SEGMENTS = int(os.getenv("PARALLEL_SEGMENTS", "4"))
+
+stats = {"downloads": 0, "failures": 0, "bytes": 0, "seconds": 0.0, "resumes": 0, "segmented": 0, "active": 0}
+
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, read=120.0),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENT_DOWNLOADS * PARALLEL_SEGMENTS, max_keepalive_connections=10),
+        )
+    return _client
+
+async def close():
+    """Closes the shared HTTP client (called on server shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _range_start(content_range: str | None) -> int | None:
+    """Returns the first byte position of a `Content-Range: bytes start-end/total` header."""
+    try:
+        unit, _, spec = (content_range or "").partition(" ")
+        return int(spec.split("-", 1)[0]) if unit == "bytes" else None
+    except ValueError:
+        return None
+
+def throughput() -> float:
+    """Average download throughput in bytes per second since startup."""
+    return stats["bytes"] / stats["seconds"] if stats["seconds"] else 0.0
+
+
+class _BufferedWriter:
+    """Collects small network chunks and writes them at `offset` in large blocks, off the event loop."""
+
+    def __init__(self, fd: int, offset: int):
+        self.fd = fd
+        self.offset = offset  # Position up to which data is on disk.
+        self.buffer = bytearray()
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= DOWNLOAD_BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self.buffer:
+            data, self.buffer = bytes(self.buffer), bytearray()
+            await asyncio.to_thread(os.pwrite, self.fd, data, self.offset)
+            self.offset += len(data)
+
+
+async def _fetch_range(url: str, fd: int, start: int, end: int | None) -> int:
+    """
+    Downloads bytes [start, end] (or [start, EOF) when end is None) into `fd` at the same offsets,
+    resuming from the last flushed position after transport errors. Returns the end offset.
+    """
+    writer = _BufferedWriter(fd, start)
+    attempt = 0
+    while True:
+        headers = {}
+        if writer.offset > 0 or end is not None:
+            headers["Range"] = f"bytes={writer.offset}-{'' if end is None else end}"
+        try:
+            async with get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 416 and end is None and writer.offset > 0:
+                    # The resumed part is not a prefix of this resource: start over from zero.
+                    writer.offset = 0
+                    continue
+                response.raise_for_status()
+                partial = response.status_code == 206
+                if headers and partial and _range_start(response.headers.get("content-range")) != writer.offset:
+                    if end is not None:
+                        raise httpx.HTTPError("Server returned a different range than requested.")
+                    writer.offset = 0
+                    continue
+                if headers and not partial:
+                    if end is not None:
+                        raise httpx.HTTPError("Server ignored the Range request.")
+                    # Full body instead of the requested range: start over from zero.
+                    writer.offset = 0
+                async for chunk in response.aiter_bytes(DOWNLOAD_BUFFER_SIZE):
+                    await writer.write(chunk)
+            await writer.flush()
+            return writer.offset
+        except httpx.TransportError:
+            writer.buffer = bytearray()  # Unflushed bytes are re-requested.
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            stats["resumes"] += 1
+            await asyncio.sleep(0.5 * 2 ** attempt)
+            attempt += 1
+
+async def _probe(url: str) -> tuple:
+    """Returns (content_length, accepts_ranges) from a HEAD request, or (None, False)."""
+    try:
+        response = await get_client().head(url)
+        if response.status_code >= 400:
+            return None, False
+        length = response.headers.get("content-length")
+        accepts_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+        return (int(length) if length and length.isdigit() else None), accepts_ranges
+    except httpx.HTTPError:
+        return None, False
+
+async def download(url: str, save_path: str) -> int:
+    """
+    Downloads `url` to `save_path` and returns the number of bytes written.
+    Data is written to `<save_path>.part` and moved into place only when complete; a part file
+    already at that path is resumed from its size.
+    At most MAX_CONCURRENT_DOWNLOADS downloads run at once.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+    part_path = f"{save_path}.part"
+    with tracing.span("download", url=url) as span:
+        waited = time.perf_counter()
+        async with _semaphore:
+            stats["active"] += 1
+            started = time.perf_counter()
+            span.set(queue_wait_ms=round((started - waited) * 1000, 3))
+            fd = await asyncio.to_thread(os.open, part_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                resume_from = (await asyncio.to_thread(os.fstat, fd)).st_size
+                size, accepts_ranges = await _probe(url)
+                if resume_from:
+                    stats["resumes"] += 1
+                    span.set(resumed_from=resume_from)
+                    written = await _fetch_range(url, fd, resume_from, None)
+                    await asyncio.to_thread(os.ftruncate, fd, written)
+                elif size and accepts_ranges and size >= PARALLEL_SEGMENT_THRESHOLD and PARALLEL_SEGMENTS > 1:
+                    stats["segmented"] += 1
+                    span.set(segments=PARALLEL_SEGMENTS)
+                    await asyncio.to_thread(os.ftruncate, fd, size)
+                    step = -(-size // PARALLEL_SEGMENTS)
+                    await asyncio.gather(*(
+                        _fetch_range(url, fd, start, min(start + step, size) - 1)
+                        for start in range(0, size, step)
+                    ))
+                    written = size
+                else:
+                    written = await _fetch_range(url, fd, 0, None)
+                    await asyncio.to_thread(os.ftruncate, fd, written)
+            except BaseException:
+                # Range retries are exhausted; callers never reuse a path, so nothing would resume the part.
+                stats["failures"] += 1
+                await asyncio.to_thread(os.close, fd)
+                await asyncio.to_thread(os.remove, part_path)
+                raise
+            finally:
+                stats["active"] -= 1
+
+            await asyncio.to_thread(os.close, fd)
+            await asyncio.to_thread(os.replace, part_path, save_path)
+            stats["downloads"] += 1
+            stats["bytes"] += written
+            stats["seconds"] += time.perf_counter() - started
+            span.set(bytes=written)
+            return written
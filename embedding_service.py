@@ -0,0 +1,296 @@
+import os
+import time
+import struct
+import signal
+import asyncio
+import argparse
+
+# Out-of-process sentence embeddings shared by every server worker.
+# Without it each uvicorn worker loads its own copy of the MiniLM model (and torch).
+# Run one sidecar per host instead:
+#
+#   python embedding_service.py --socket /tmp/tiwa-embed.sock
+#
+# and set EMBEDDING_SOCKET to the same path for the server. The sidecar holds the model
+# once and batches requests from all workers into shared encode calls. Workers talk to it
+# over a Unix domain socket with a small binary framing, so they never import torch.
+#
+# Every frame starts with a little-endian header (body length, request id, count/status):
+#   request:  count texts, each a u32 byte length followed by UTF-8
+#   response: status 0 -> u32 rows, u32 dim, then rows * dim float32
+#             status 1 -> UTF-8 error message
+
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET")
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))
+# When the sidecar is unreachable, encode in-process (loads the model in this worker).
+EMBEDDING_FALLBACK = os.getenv("EMBEDDING_FALLBACK", "1") == "1"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# How long the sidecar waits for more requests before encoding a partial batch.
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+_HEADER = struct.Struct("<III")
+_U32 = struct.Struct("<I")
+_SHAPE = struct.Struct("<II")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Client side, per server worker.
+stats = {"requests": 0, "texts": 0, "errors": 0, "fallbacks": 0, "connects": 0, "seconds": 0.0}
+
+
+class EmbeddingServiceError(Exception):
+    """The sidecar could not be reached or failed to encode a request."""
+
+
+def encode_request(request_id: int, texts: list) -> bytes:
+    body = b"".join(_U32.pack(len(data)) + data for data in (text.encode("utf-8") for text in texts))
+    return _HEADER.pack(len(body), request_id, len(texts)) + body
+
+def decode_request(count: int, body: bytes) -> list:
+    texts, offset = [], 0
+    for _ in range(count):
+        (length,) = _U32.unpack_from(body, offset)
+        offset += _U32.size
+        texts.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+    return texts
+
+def encode_vectors(request_id: int, vectors) -> bytes:
+    rows, dim = vectors.shape
+    body = _SHAPE.pack(rows, dim) + vectors.astype("<f4", copy=False).tobytes()
+    return _HEADER.pack(len(body), request_id, STATUS_OK) + body
+
+def encode_error(request_id: int, message: str) -> bytes:
+    body = message.encode("utf-8")
+    return _HEADER.pack(len(body), request_id, STATUS_ERROR) + body
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple:
+    """Returns (request_id, count_or_status, body); raises IncompleteReadError at EOF."""
+    length, request_id, value = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return request_id, value, await reader.readexactly(length)
+
+
+# --- Client ---
+
+class _Connection:
+    """One socket to the sidecar and the requests awaiting a response on it."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending: dict = {}  # request_id -> Future
+        self.closed = False
+
+
+class EmbeddingClient:
+    """One persistent, pipelined connection from a worker to the sidecar, reopened when it drops."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: _Connection | None = None
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    async def _connect(self) -> _Connection:
+        async with self._connect_lock:
+            connection = self._connection
+            if connection is not None and not connection.closed and not connection.writer.is_closing():
+                return connection
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                raise EmbeddingServiceError(f"cannot connect to {self.path}: {e}") from e
+            stats["connects"] += 1
+            connection = self._connection = _Connection(writer)
+            asyncio.create_task(self._read_responses(reader, connection))
+            return connection
+
+    async def _read_responses(self, reader, connection: _Connection):
+        import numpy as np
+        error = EmbeddingServiceError("connection closed")
+        try:
+            while True:
+                request_id, status, body = await read_frame(reader)
+                future = connection.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue  # The caller timed out or was cancelled.
+                if status == STATUS_OK:
+                    rows, dim = _SHAPE.unpack_from(body)
+                    future.set_result(np.frombuffer(body, dtype="<f4", offset=_SHAPE.size).reshape(rows, dim))
+                else:
+                    future.set_exception(EmbeddingServiceError(body.decode("utf-8", "replace")))
+        except (asyncio.IncompleteReadError, OSError) as e:
+            error = EmbeddingServiceError(f"connection lost: {e}")
+        finally:
+            # Only this connection's state is torn down; a newer connection is left alone.
+            connection.closed = True
+            connection.writer.close()
+            if self._connection is connection:
+                self._connection = None
+            for future in connection.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            connection.pending.clear()
+
+    async def encode(self, texts: list):
+        """Returns a (len(texts), dim) float32 numpy array."""
+        connection = await self._connect()
+        self._next_id = (self._next_id + 1) % 2**32
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        connection.pending[request_id] = future
+        try:
+            async with self._write_lock:
+                if connection.closed:
+                    raise EmbeddingServiceError("connection closed before the request was sent")
+                connection.writer.write(encode_request(request_id, texts))
+                await connection.writer.drain()
+            return await asyncio.wait_for(future, EMBEDDING_TIMEOUT)
+        except OSError as e:
+            raise EmbeddingServiceError(f"send failed: {e}") from e
+        finally:
+            connection.pending.pop(request_id, None)
+
+_client: EmbeddingClient | None = None
+
+async def encode(texts: list):
+    """Encodes texts on the sidecar at EMBEDDING_SOCKET. Raises EmbeddingServiceError or TimeoutError."""
+    global _client
+    if _client is None:
+        _client = EmbeddingClient(EMBEDDING_SOCKET)
+    started = time.perf_counter()
+    stats["requests"] += 1
+    stats["texts"] += len(texts)
+    try:
+        return await _client.encode(texts)
+    except (EmbeddingServiceError, asyncio.TimeoutError):
+        stats["errors"] += 1
+        raise
+    finally:
+        stats["seconds"] += time.perf_counter() - started
+
+
+# --- Sidecar ---
+
+service_stats = {"connections": 0, "requests": 0, "texts": 0, "batches": 0, "max_batch_texts": 0,
+                 "errors": 0, "encode_seconds": 0.0}
+
+
+class Batcher:
+    """Collects requests from all connections and encodes them together, one batch at a time."""
+
+    def __init__(self, model):
+        self.model = model
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def encode(self, texts: list):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            total = len(batch[0][0])
+            deadline = time.perf_counter() + EMBEDDING_BATCH_WAIT_MS / 1000
+            while total < EMBEDDING_BATCH_SIZE:
+                remaining = deadline - time.perf_counter()
+                try:
+                    # Past the deadline, only take what is already queued.
+                    item = await asyncio.wait_for(self.queue.get(), remaining) if remaining > 0 else self.queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                batch.append(item)
+                total += len(item[0])
+            await self._encode_batch(batch, total)
+
+    async def _encode_batch(self, batch: list, total: int):
+        texts = [text for item, _ in batch for text in item]
+        started = time.perf_counter()
+        try:
+            vectors = await asyncio.to_thread(self.model.encode, texts, batch_size=EMBEDDING_BATCH_SIZE,
+                                              convert_to_numpy=True)
+        except Exception as e:
+            service_stats["errors"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        service_stats["batches"] += 1
+        service_stats["max_batch_texts"] = max(service_stats["max_batch_texts"], total)
+        service_stats["encode_seconds"] += time.perf_counter() - started
+        offset = 0
+        for item, future in batch:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(item)])
+            offset += len(item)
+
+async def _serve_request(batcher: Batcher, writer, write_lock, request_id: int, texts: list):
+    try:
+        frame = encode_vectors(request_id, await batcher.encode(texts))
+    except Exception as e:
+        frame = encode_error(request_id, f"{type(e).__name__}: {e}")
+    async with write_lock:
+        if not writer.is_closing():
+            writer.write(frame)
+            await writer.drain()
+
+async def _handle_connection(batcher: Batcher, reader, writer):
+    service_stats["connections"] += 1
+    write_lock = asyncio.Lock()
+    tasks = set()
+    try:
+        while True:
+            request_id, count, body = await read_frame(reader)
+            service_stats["requests"] += 1
+            service_stats["texts"] += count
+            # Requests are served concurrently so pipelined ones land in the same batch.
+            task = asyncio.create_task(_serve_request(batcher, writer, write_lock, request_id, decode_request(count, body)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass  # Client went away, or the service is shutting down.
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+        service_stats["connections"] -= 1
+
+async def serve(path: str, model_name: str):
+    from sentence_transformers import SentenceTransformer
+    started = time.perf_counter()
+    model = await asyncio.to_thread(SentenceTransformer, model_name)
+    await asyncio.to_thread(model.encode, ["warmup"])
+    print(f"Loaded {model_name} in {time.perf_counter() - started:.1f}s.", flush=True)
+
+    batcher = Batcher(model)
+    batch_task = asyncio.create_task(batcher.run())
+    if os.path.exists(path):
+        os.unlink(path)  # Stale socket from a previous run.
+    server = await asyncio.start_unix_server(lambda r, w: _handle_connection(batcher, r, w), path=path)
+    os.chmod(path, 0o660)
+    # Shut down cleanly on SIGTERM too, so the socket file does not outlive the process.
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f"Embedding service listening on {path}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared sentence-embedding sidecar for TIWA workers.")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET or "/tmp/tiwa-embed.sock")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.model))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+# In-memory event bus. Producers publish events on a topic (e.g. "project:<id>"),
+# each topic keeps a bounded, sequence-numbered history so pollers can ask for
+# "everything since seq N", and listeners get every new event pushed to them.
+
+MAX_EVENTS_PER_TOPIC = 500
+
+# Listener of the connection currently being served. The server sets this around
+# each prompt so that work started by that prompt can route events back to it.
+current_listener: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("current_listener", default=None)
+
+
+
+class ListenerGroup:
+    """
+    Several connections waiting on one shared piece of work (e.g. a coalesced upload).
+    Used as that work's listener: events reach every member, and the work counts as
+    abandoned only once every member has been released.
+    """
+
+    def __init__(self, *listeners):
+        self.listeners: list = []
+        for listener in listeners:
+            self.add(listener)
+
+    def add(self, listener):
+        if listener is not None and listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def release(self, listener) -> bool:
+        """Removes a listener, also from nested groups. Returns True if that left this group empty."""
+        had_members = bool(self.listeners)
+        for member in list(self.listeners):
+            if member == listener or (isinstance(member, ListenerGroup) and member.release(listener)):
+                self.listeners.remove(member)
+        return had_members and not self.listeners
+
+    def __call__(self, event: dict):
+        for listener in list(self.listeners):
+            listener(event)
+
+_history: Dict[str, deque] = {}
+_last_seq: Dict[str, int] = {}
+_listeners: Dict[str, List[Callable[[dict], None]]] = {}
+
+
+def publish(topic: str, event_type: str, data: dict = None) -> dict:
+    """
+    Records an event on a topic and pushes it to the topic's listeners.
+    Listeners are plain callables and must not block (e.g. `queue.put_nowait`).
+    """
+    seq = _last_seq.get(topic, 0) + 1
+    _last_seq[topic] = seq
+    event = {"topic": topic, "seq": seq, "event": event_type, "data": data or {}, "ts": time.time()}
+    _history.setdefault(topic, deque(maxlen=MAX_EVENTS_PER_TOPIC)).append(event)
+
+    for listener in list(_listeners.get(topic, [])):
+        try:
+            listener(event)
+        except Exception as e:
+            print(f"Event listener error on {topic}: {e}", flush=True)
+    return event
+
+def subscribe(topic: str, listener: Callable[[dict], None]):
+    """Registers a listener for a topic. Subscribing twice is a no-op."""
+    listeners = _listeners.setdefault(topic, [])
+    if listener not in listeners:
+        listeners.append(listener)
+
+def subscribe_current(topic: str) -> bool:
+    """Subscribes the current connection's listener (if any) to a topic."""
+    listener = current_listener.get()
+    if listener is None:
+        return False
+    subscribe(topic, listener)
+    return True
+
+def unsubscribe(topic: str, listener: Callable[[dict], None]):
+    """Removes a listener from a topic."""
+    listeners = _listeners.get(topic)
+    if listeners and listener in listeners:
+        listeners.remove(listener)
+        if not listeners:
+            del _listeners[topic]
+
+def unsubscribe_all(listener: Callable[[dict], None]):
+    """Removes a listener from every topic, e.g. when its connection closes."""
+    for topic in list(_listeners):
+        unsubscribe(topic, listener)
+
+def forget(topic: str):
+    """
+    Drops a topic's history, sequence and listeners once nothing will publish on it again.
+    Listeners receive events synchronously, so everything already published has reached them.
+    """
+    _history.pop(topic, None)
+    _last_seq.pop(topic, None)
+    _listeners.pop(topic, None)
+
+def latest_seq(topic: str) -> int:
+    """Returns the sequence number of the newest event on a topic (0 if none)."""
+    return _last_seq.get(topic, 0)
+
+def events_since(topic: str, since_seq: int = 0) -> dict:
+    """
+    Returns the events on a topic newer than `since_seq`.
+    `truncated` is True when older events were already dropped from the history,
+    in which case the caller should re-read the full state once.
+    """
+    history = _history.get(topic, ())
+    events = [event for event in history if event["seq"] > since_seq]
+    oldest = history[0]["seq"] if history else latest_seq(topic) + 1
+    return {
+        "latest_seq": latest_seq(topic),
+        "truncated": since_seq + 1 < oldest,
+        "events": events,
+    }
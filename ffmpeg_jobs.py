@@ -0,0 +1,222 @@
+import os
+import time
+import uuid
+import asyncio
+import itertools
+import contextvars
+from collections import deque
+
+import events
+import tracing
+
+# Scheduler for ffmpeg processes.
+# Jobs wait in a priority queue and a fixed pool of workers, sized from the CPU count,
+# runs them as asyncio subprocesses. ffmpeg's `-progress` output is parsed into percent
+# complete and published on the event bus, so the connection that submitted a job sees
+# progress frames. Jobs are cancelled (and their process killed) when their connection
+# goes away or when the awaiting coroutine is cancelled.
+
+FFMPEG_MAX_WORKERS = int(os.getenv("FFMPEG_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+STDERR_TAIL_LINES = 50
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "queued": 0, "running": 0,
+         "queue_wait_seconds": 0.0, "run_seconds": 0.0}
+# Timing of the most recent jobs, newest last.
+recent_jobs = deque(maxlen=100)
+
+_queue: asyncio.PriorityQueue | None = None
+_workers: list = []
+_jobs: dict = {}
+_order = itertools.count()
+
+
+class FFmpegError(Exception):
+    """Raised when ffmpeg exits with a non-zero status."""
+
+
+class FFmpegJob:
+    """A queued or running ffmpeg invocation."""
+
+    def __init__(self, command: list, priority: int, duration: float | None, label: str, owner):
+        self.job_id = str(uuid.uuid4())
+        self.command = command
+        self.priority = priority
+        self.duration = duration
+        self.label = label
+        self.owner = owner
+        self.topic = f"ffmpeg:{self.job_id}"
+        self.future = asyncio.get_running_loop().create_future()
+        self.process = None
+        self.percent = 0.0
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+
+    def publish(self, status: str):
+        events.publish(self.topic, "ffmpeg_progress", {
+            "job_id": self.job_id,
+            "label": self.label,
+            "status": status,
+            "percent": round(self.percent, 1),
+        })
+
+    def finish(self, status: str):
+        """Publishes the terminal status, then drops the job's topic from the event bus."""
+        self.publish(status)
+        events.forget(self.topic)
+
+
+def _ensure_workers():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.PriorityQueue()
+    if not _workers:
+        # Workers serve every connection, so they must not inherit the first caller's ContextVars.
+        _workers.extend(asyncio.create_task(_worker(), context=contextvars.Context()) for _ in range(FFMPEG_MAX_WORKERS))
+
+async def _worker():
+    while True:
+        _, _, job = await _queue.get()
+        stats["queued"] -= 1
+        if job.future.done():
+            continue  # Cancelled while waiting in the queue.
+        stats["running"] += 1
+        try:
+            await _execute(job)
+        except Exception as e:
+            if not job.future.done():
+                stats["failed"] += 1
+                job.future.set_exception(e)
+        finally:
+            stats["running"] -= 1
+            _jobs.pop(job.job_id, None)
+
+async def _read_progress(job: FFmpegJob, stream):
+    last_published = -1.0
+    async for raw_line in stream:
+        key, _, value = raw_line.decode(errors="replace").strip().partition("=")
+        if key in ("out_time_us", "out_time_ms") and job.duration and value.isdigit():
+            # Both keys are reported in microseconds.
+            job.percent = min(100.0, int(value) / 1_000_000 / job.duration * 100)
+        elif key == "progress" and value == "end":
+            job.percent = 100.0
+        if job.percent - last_published >= 1.0:
+            last_published = job.percent
+            job.publish("running")
+
+async def _read_stderr(stream, tail: deque):
+    async for raw_line in stream:
+        tail.append(raw_line.decode(errors="replace").rstrip())
+
+async def _execute(job: FFmpegJob):
+    job.started_at = time.perf_counter()
+    queue_wait = job.started_at - job.submitted_at
+    stats["queue_wait_seconds"] += queue_wait
+    job.publish("started")
+
+    command = [job.command[0], "-progress", "pipe:1", "-nostats", *job.command[1:]]
+    job.process = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    try:
+        await asyncio.gather(
+            _read_progress(job, job.process.stdout),
+            _read_stderr(job.process.stderr, stderr_tail),
+            job.process.wait(),
+        )
+    finally:
+        if job.process.returncode is None:
+            job.process.kill()
+            await job.process.wait()
+
+    run_seconds = time.perf_counter() - job.started_at
+    stats["run_seconds"] += run_seconds
+    if job.future.done():
+        status = "cancelled"
+    elif job.process.returncode == 0:
+        status = "completed"
+        stats["completed"] += 1
+        job.future.set_result("\n".join(stderr_tail))
+    else:
+        status = "failed"
+        stats["failed"] += 1
+        job.future.set_exception(FFmpegError("\n".join(stderr_tail) or f"ffmpeg exited with {job.process.returncode}"))
+    recent_jobs.append({"job_id": job.job_id, "label": job.label, "status": status,
+                        "queue_wait_seconds": queue_wait, "run_seconds": run_seconds})
+    job.finish(status)
+
+
+def submit(command: list, priority: int = PRIORITY_NORMAL, duration: float = None, label: str = "ffmpeg") -> FFmpegJob:
+    """
+    Queues an ffmpeg command (a list starting with "ffmpeg"). `duration` (seconds of output)
+    enables percent-complete progress. The current connection, if any, owns the job and is
+    subscribed to its progress events.
+    """
+    _ensure_workers()
+    job = FFmpegJob(command, priority, duration, label, events.current_listener.get())
+    events.subscribe_current(job.topic)
+    _jobs[job.job_id] = job
+    stats["submitted"] += 1
+    stats["queued"] += 1
+    _queue.put_nowait((priority, next(_order), job))
+    job.publish("queued")
+    return job
+
+def cancel(job: FFmpegJob):
+    """Cancels a job: drops it from the queue or kills its running process."""
+    if job.future.done():
+        return
+    job.future.cancel()
+    stats["cancelled"] += 1
+    if job.process and job.process.returncode is None:
+        job.process.kill()
+    if not job.started_at:
+        _jobs.pop(job.job_id, None)
+        recent_jobs.append({"job_id": job.job_id, "label": job.label, "status": "cancelled",
+                            "queue_wait_seconds": time.perf_counter() - job.submitted_at, "run_seconds": 0.0})
+        job.finish("cancelled")
+
+def cancel_owner(owner) -> int:
+    """
+    Cancels every job owned by a connection (e.g. when it disconnects). A job owned by a
+    ListenerGroup is only cancelled once every member of the group has gone. Returns the count.
+    """
+    owned = [job for job in list(_jobs.values())
+             if job.owner == owner or (isinstance(job.owner, events.ListenerGroup) and job.owner.release(owner))]
+    for job in owned:
+        cancel(job)
+    return len(owned)
+
+async def run(command: list, priority: int = PRIORITY_NORMAL, duration: float = None, label: str = "ffmpeg") -> str:
+    """
+    Submits an ffmpeg command and waits for it. Returns the tail of ffmpeg's stderr.
+    Raises FFmpegError on failure and FileNotFoundError when ffmpeg is not installed.
+    Cancelling the caller cancels the job.
+    """
+    job = submit(command, priority, duration, label)
+    with tracing.span("ffmpeg", label=label, priority=priority) as span:
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            cancel(job)
+            raise
+        finally:
+            if job.started_at:
+                span.set(queue_wait_ms=round((job.started_at - job.submitted_at) * 1000, 3))
+
+async def probe_duration(path: str) -> float | None:
+    """Returns a media file's duration in seconds using ffprobe, or None if unknown."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        return float(stdout.decode().strip())
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,35 @@
+import os
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared, lazily imported Gemini SDK.
+# google.generativeai takes about a second to import, so it is loaded (and configured)
+# on first use rather than when the server starts. Use `await load_genai()` from the
+# event loop so that first import happens in a worker thread.
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Optional endpoint override (e.g. the local stubs in bench/); the REST transport lets plain http:// work.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+_genai = None
+_lock = threading.Lock()
+
+
+def get_genai():
+    """Returns the configured google.generativeai module, importing it on first call. Blocking."""
+    global _genai
+    with _lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if GEMINI_API_KEY:
+                options = {"transport": "rest", "client_options": {"api_endpoint": GEMINI_API_ENDPOINT}} if GEMINI_API_ENDPOINT else {}
+                genai.configure(api_key=GEMINI_API_KEY, **options)
+            _genai = genai
+    return _genai
+
+async def load_genai():
+    """Event-loop friendly `get_genai()`: the first import runs in a worker thread."""
+    return _genai if _genai is not None else await asyncio.to_thread(get_genai)
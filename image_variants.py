@@ -0,0 +1,100 @@
+import os
+import json
+
+import storage
+
+# Responsive variants for generated images.
+# After an image is generated, smaller WebP (and AVIF, when Pillow supports it) renditions
+# are written next to it, plus a JSON manifest listing every variant's URL, size and type.
+# The chat UI turns the manifest into a srcset so browsers download the smallest adequate file.
+
+try:
+    from PIL import Image, features
+    AVIF_SUPPORTED = features.check("avif")
+except ImportError:
+    Image = None
+    AVIF_SUPPORTED = False
+    print("Warning: Pillow not installed. Image variants will not be generated.", flush=True)
+
+VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "256,512,768").split(",") if w.strip()]
+WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+AVIF_QUALITY = int(os.getenv("IMAGE_AVIF_QUALITY", "50"))
+
+stats = {"images": 0, "variants": 0, "original_bytes": 0, "bytes_saved": 0}
+
+
+def manifest_path(image_path: str) -> str:
+    """Returns the manifest location for an image (static/ab/<uuid>.png -> static/ab/<uuid>.json)."""
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}.json"
+
+def _describe(path: str, width: int, height: int, mime_type: str) -> dict:
+    return {
+        "url": "/" + path.replace(os.sep, "/"),
+        "width": width,
+        "height": height,
+        "bytes": os.path.getsize(path),
+        "type": mime_type,
+    }
+
+def build_variants(image_path: str) -> dict | None:
+    """
+    Writes WebP/AVIF variants of an image at VARIANT_WIDTHS and its full width, plus a manifest.
+    Blocking; run it with asyncio.to_thread and register the image and the written files with
+    the storage manager afterwards as one group (see `written_paths`). Returns the manifest,
+    or None without Pillow.
+    """
+    if Image is None:
+        return None
+
+    stem, _ = os.path.splitext(image_path)
+    formats = [("webp", "image/webp", {"quality": WEBP_QUALITY, "method": 4})]
+    if AVIF_SUPPORTED:
+        formats.append(("avif", "image/avif", {"quality": AVIF_QUALITY}))
+
+    with Image.open(image_path) as original:
+        original.load()
+        width, height = original.size
+        mime_type = Image.MIME.get(original.format, "image/png")
+        source = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+
+    manifest = {"original": _describe(image_path, width, height, mime_type), "variants": []}
+    for target_width in sorted({w for w in VARIANT_WIDTHS if w < width} | {width}):
+        target_height = round(height * target_width / width)
+        resized = source if target_width == width else source.resize((target_width, target_height), Image.LANCZOS)
+        for extension, variant_type, options in formats:
+            variant_path = f"{stem}.{target_width}.{extension}"
+            resized.save(variant_path, format=extension.upper(), **options)
+            manifest["variants"].append(_describe(variant_path, target_width, target_height, variant_type))
+
+    # Savings for a full-width display: the original versus the smallest full-width variant.
+    full_width = [v["bytes"] for v in manifest["variants"] if v["width"] == width]
+    manifest["bytes_saved"] = max(0, manifest["original"]["bytes"] - min(full_width)) if full_width else 0
+
+    with open(manifest_path(image_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    stats["images"] += 1
+    stats["variants"] += len(manifest["variants"])
+    stats["original_bytes"] += manifest["original"]["bytes"]
+    stats["bytes_saved"] += manifest["bytes_saved"]
+    return manifest
+
+def written_paths(image_path: str, manifest: dict) -> list:
+    """Returns the files `build_variants` wrote for an image: every variant and the manifest."""
+    return [v["url"].lstrip("/") for v in manifest["variants"]] + [manifest_path(image_path)]
+
+def forget_path(path: str):
+    """
+    Storage eviction hook: removes the manifest once the image or any variant it lists is gone.
+    Grouped registration already evicts them together; this covers files adopted without a group.
+    """
+    if os.path.splitext(path)[1] not in (".png", ".webp", ".avif"):
+        return
+    stem = os.path.basename(path).split(".", 1)[0]
+    try:
+        os.remove(os.path.join(os.path.dirname(path), f"{stem}.json"))
+    except FileNotFoundError:
+        pass
+
+storage.eviction_hooks.append(forget_path)
@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import hashlib
+import contextvars
+import mimetypes
+from collections import OrderedDict
+
+import events
+import upload_store
+import transcode
+import tracing
+from gemini_client import load_genai
+
+# Gemini media analysis with reuse.
+# Files are identified by the SHA-256 of their bytes. A remote Gemini file handle is kept
+# for each hash until shortly before it expires, so asking again about the same media
+# skips the upload and processing wait. Finished analyses are cached per (hash, prompt),
+# and concurrent requests for the same file or analysis share one in-flight operation.
+
+ANALYSIS_MODEL = "gemini-1.5-flash-latest"
+ANALYSIS_CACHE_SIZE = int(os.getenv("MEDIA_ANALYSIS_CACHE_SIZE", "256"))
+# Remote handles expiring within this many seconds are not reused.
+REMOTE_FILE_EXPIRY_MARGIN = 600
+# Files without a reported expiration are assumed to live this long (Gemini keeps files 48h).
+REMOTE_FILE_DEFAULT_TTL = 47 * 3600
+PROCESSING_TIMEOUT = float(os.getenv("MEDIA_PROCESSING_TIMEOUT", "600"))
+
+# upload_seconds includes Gemini's processing until the file is active; upload_transfer_seconds does not.
+stats = {"uploads": 0, "upload_bytes": 0, "upload_seconds": 0.0, "upload_transfer_seconds": 0.0,
+         "remote_reuses": 0, "cache_hits": 0, "coalesced": 0, "analyses": 0}
+
+_remote_files: dict = {}          # digest -> {"name", "mime_type", "expires_at", "file"}
+_analyses: OrderedDict = OrderedDict()  # (digest, prompt) -> text
+_inflight: dict = {}              # key -> {"task": asyncio.Task, "waiters": int, "group": ListenerGroup}
+_digests: dict = {}               # (path, size, mtime) -> digest
+
+
+class MediaAnalysisError(Exception):
+    """Raised when Gemini rejects or fails to process a media file."""
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def file_digest(path: str) -> str:
+    """Returns the SHA-256 of a file, reusing the upload id or a previous hash when possible."""
+    file_id = upload_store.file_id_for_path(path)
+    if file_id:
+        return file_id
+    st = await asyncio.to_thread(os.stat, path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if key not in _digests:
+        _digests[key] = await asyncio.to_thread(_hash_file, path)
+    return _digests[key]
+
+def upload_throughput() -> float:
+    """Observed bytes per second for Gemini uploads, counting only the transfer itself."""
+    return stats["upload_bytes"] / stats["upload_transfer_seconds"] if stats["upload_transfer_seconds"] else 0.0
+
+
+async def _coalesce(key, factory):
+    """
+    Runs `factory()` once per key; concurrent callers with the same key await the same result.
+    The work runs in its own task, so cancelling one caller leaves it running for the others;
+    it is cancelled only when every caller waiting on it has gone.
+    """
+    listener = events.current_listener.get()
+    entry = _inflight.get(key)
+    if entry is None:
+        # Jobs started by the shared work (e.g. a transcode) belong to every waiting connection.
+        group = events.ListenerGroup(listener)
+        context = contextvars.copy_context()
+        context.run(events.current_listener.set, group)
+        entry = {"task": asyncio.create_task(factory(), context=context), "waiters": 0, "group": group}
+        _inflight[key] = entry
+        entry["task"].add_done_callback(lambda _: _inflight.pop(key, None) if _inflight.get(key) is entry else None)
+    else:
+        stats["coalesced"] += 1
+        entry["group"].add(listener)
+    entry["waiters"] += 1
+    try:
+        return await asyncio.shield(entry["task"])
+    finally:
+        entry["waiters"] -= 1
+        entry["group"].release(listener)
+        if entry["waiters"] == 0 and not entry["task"].done():
+            entry["task"].cancel()
+
+async def _wait_until_active(media_file):
+    """Polls an uploaded file with exponential backoff until Gemini finishes processing it."""
+    genai = await load_genai()
+    delay, waited = 0.5, 0.0
+    while media_file.state.name == "PROCESSING":
+        if waited > PROCESSING_TIMEOUT:
+            raise MediaAnalysisError("Timed out waiting for media processing.")
+        await asyncio.sleep(delay)
+        waited += delay
+        delay = min(delay * 1.5, 5.0)
+        media_file = await asyncio.to_thread(genai.get_file, media_file.name)
+    if media_file.state.name == "FAILED":
+        raise MediaAnalysisError(f"Media file processing failed. Reason: {media_file.state.name}")
+    return media_file
+
+async def _upload(path: str, digest: str) -> dict:
+    # Upload a smaller transcode when one helps; it answers the same questions for fewer bytes.
+    path = await transcode.prepare(path, digest, upload_throughput())
+    genai = await load_genai()
+    started = time.perf_counter()
+    with tracing.span("gemini_upload", bytes=os.path.getsize(path)) as span:
+        media_file = await asyncio.to_thread(genai.upload_file, path=path)
+        transfer_seconds = time.perf_counter() - started
+        span.set(upload_ms=round(transfer_seconds * 1000, 3))
+        try:
+            media_file = await _wait_until_active(media_file)
+        except Exception:
+            await asyncio.to_thread(genai.delete_file, media_file.name)
+            raise
+    stats["uploads"] += 1
+    stats["upload_bytes"] += os.path.getsize(path)
+    stats["upload_seconds"] += time.perf_counter() - started
+    stats["upload_transfer_seconds"] += transfer_seconds
+
+    expiration = getattr(media_file, "expiration_time", None)
+    expires_at = expiration.timestamp() if expiration else time.time() + REMOTE_FILE_DEFAULT_TTL
+    remote = {"name": media_file.name, "mime_type": media_file.mime_type, "expires_at": expires_at, "file": media_file}
+    _remote_files[digest] = remote
+    return remote
+
+async def get_remote_file(path: str, digest: str) -> dict:
+    """Returns a usable remote file handle for the media, uploading it only if needed."""
+    remote = _remote_files.get(digest)
+    if remote and remote["expires_at"] - time.time() > REMOTE_FILE_EXPIRY_MARGIN:
+        stats["remote_reuses"] += 1
+        return remote
+    _remote_files.pop(digest, None)
+    return await _coalesce(("upload", digest), lambda: _upload(path, digest))
+
+
+def prompt_for(mime_type: str) -> str | None:
+    """Returns the analysis instruction for a media type, or None if it is unsupported."""
+    if mime_type and "video" in mime_type:
+        return "Describe the contents of this video in detail."
+    if mime_type and "audio" in mime_type:
+        return "Transcribe the speech in this audio file."
+    return None
+
+async def _run_analysis(path: str, digest: str, prompt: str) -> str:
+    genai = await load_genai()
+    model = genai.GenerativeModel(ANALYSIS_MODEL)
+    while True:
+        reused = digest in _remote_files
+        remote = await get_remote_file(path, digest)
+        try:
+            with tracing.span("gemini_analysis", reused_upload=reused):
+                response = await asyncio.to_thread(model.generate_content, [prompt, remote["file"]])
+        except Exception:
+            # A reused handle may have been deleted remotely; drop it and upload once more.
+            _remote_files.pop(digest, None)
+            if not reused:
+                raise
+            continue
+        stats["analyses"] += 1
+        return response.text.strip()
+
+async def analyze(path: str) -> str:
+    """
+    Analyzes a video or audio file with Gemini, reusing remote uploads and previous results.
+    Raises MediaAnalysisError for unsupported or failed media.
+    """
+    digest = await file_digest(path)
+    mime_type, _ = mimetypes.guess_type(path)
+    if not prompt_for(mime_type):
+        remote = await get_remote_file(path, digest)
+        mime_type = remote["mime_type"]
+    prompt = prompt_for(mime_type)
+    if not prompt:
+        raise MediaAnalysisError(f"Unsupported file type for analysis: {mime_type}")
+
+    key = (digest, prompt)
+    if key in _analyses:
+        stats["cache_hits"] += 1
+        _analyses.move_to_end(key)
+        return _analyses[key]
+
+    text = await _coalesce(("analysis",) + key, lambda: _run_analysis(path, digest, prompt))
+    _analyses[key] = text
+    if len(_analyses) > ANALYSIS_CACHE_SIZE:
+        _analyses.popitem(last=False)
+    return text
@@ -0,0 +1,219 @@
+import os
+import time
+import bisect
+import asyncio
+import functools
+from contextlib import contextmanager
+
+import tracing
+
+# Lightweight in-process metrics with Prometheus text exposition.
+# Counters and histograms are plain dicts keyed by label values, so recording a sample
+# is a dict update and a bisect; nothing is locked because everything runs on the event
+# loop. The `stats` dicts kept by other modules are registered here and exported as gauges.
+
+METRIC_PREFIX = "tiwa"
+
+# Seconds; covers cache hits through multi-minute media generation.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_metrics: dict = {}      # name -> Counter | Histogram
+_stats_sources: dict = {}  # name -> stats dict
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        # Text format 0.0.4 declares a counter under the same `_total` name as its samples.
+        self.family = name + "_total"
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.family, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Bucketed observations (cumulative on export) plus sum and count per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.family = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values: dict = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for key, series in self.values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield self.name + "_bucket", {**labels, "le": str(bound)}, cumulative
+            yield self.name + "_sum", labels, series[-1]
+            yield self.name + "_count", labels, cumulative
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    """Returns the counter with this name, creating it on first use."""
+    name = f"{METRIC_PREFIX}_{name}"
+    if name not in _metrics:
+        _metrics[name] = Counter(name, documentation, labelnames)
+    return _metrics[name]
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    """Returns the histogram with this name, creating it on first use."""
+    name = f"{METRIC_PREFIX}_{name}"
+    if name not in _metrics:
+        _metrics[name] = Histogram(name, documentation, labelnames, buckets)
+    return _metrics[name]
+
+def register_stats(name: str, stats: dict):
+    """Exports a module's `stats` dict as gauges named tiwa_<name>_<key>."""
+    _stats_sources[name] = stats
+
+
+# --- Pipeline Metrics ---
+
+stage_seconds = histogram("stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+stage_errors = counter("stage_errors", "Pipeline stages that raised an exception.", ("stage",))
+tool_seconds = histogram("tool_seconds", "Tool execution time.", ("tool",))
+tool_calls = counter("tool_calls", "Tool executions by outcome.", ("tool", "outcome"))
+prompts = counter("prompts", "Prompts processed by outcome.", ("outcome",))
+prompt_seconds = histogram("prompt_seconds", "End-to-end prompt time by outcome.", ("outcome",))
+provider_tokens = counter("provider_tokens", "Tokens reported by model providers.", ("provider", "kind"))
+# Stages currently running, by name (provider calls in flight, among others).
+stage_inflight: dict = {}
+register_stats("stage_inflight", stage_inflight)
+
+
+@contextmanager
+def stage(name: str, **attrs):
+    """
+    Times a pipeline stage (`with metrics.stage("gpt") as span: ...`) and records it as a
+    trace span; `attrs` and `span.set()` add payload sizes. Exceptions are counted and re-raised.
+    """
+    started = time.perf_counter()
+    stage_inflight[name] = stage_inflight.get(name, 0) + 1
+    try:
+        with tracing.span(name, **attrs) as span:
+            yield span
+    except Exception:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        stage_inflight[name] -= 1
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+def instrument_tool(name: str, function):
+    """Wraps an async tool so every call is timed and counted by outcome."""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"tool:{name}") as span:
+                result = await function(*args, **kwargs)
+                span.set(result_chars=len(result) if isinstance(result, str) else None)
+            outcome = "ok"
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            tool_seconds.observe(time.perf_counter() - started, tool=name)
+            tool_calls.inc(tool=name, outcome=outcome)
+    return wrapper
+
+def _record_tokens(provider: str, prompt_tokens: int, completion_tokens: int, span):
+    provider_tokens.inc(prompt_tokens, provider=provider, kind="prompt")
+    provider_tokens.inc(completion_tokens, provider=provider, kind="completion")
+    span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+def record_openai_usage(provider: str, response, span=tracing.NULL_SPAN):
+    """Records token usage from an OpenAI-compatible chat completion response."""
+    usage = getattr(response, "usage", None)
+    if usage:
+        _record_tokens(provider, usage.prompt_tokens or 0, usage.completion_tokens or 0, span)
+
+def record_gemini_usage(provider: str, response, span=tracing.NULL_SPAN):
+    """Records token usage from a Gemini generate_content response."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        _record_tokens(provider, usage.prompt_token_count or 0, usage.candidates_token_count or 0, span)
+
+
+# --- Event Loop Lag ---
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+event_loop_lag = histogram("event_loop_lag_seconds", "How late the event loop woke a periodic timer.",
+                           buckets=LOOP_LAG_BUCKETS)
+loop_stats = {"lag_seconds": 0.0, "lag_seconds_max": 0.0}
+register_stats("event_loop", loop_stats)
+
+async def monitor_event_loop_lag():
+    """Samples event-loop lag every LOOP_LAG_INTERVAL seconds. Run it as a background task."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL)
+        event_loop_lag.observe(lag)
+        loop_stats["lag_seconds"] = lag
+        loop_stats["lag_seconds_max"] = max(loop_stats["lag_seconds_max"], lag)
+
+
+# --- Exposition ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _line(name: str, labels: dict, value) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+def render() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics.values():
+        lines.append(f"# HELP {metric.family} {metric.documentation}")
+        lines.append(f"# TYPE {metric.family} {metric.kind}")
+        lines.extend(_line(name, labels, value) for name, labels, value in metric.samples())
+
+    for source, stats in _stats_sources.items():
+        for key, value in stats.items():
+            name = f"{METRIC_PREFIX}_{source}_{key}"
+            if isinstance(value, dict):
+                # Nested stats (e.g. per-directory evictions) become a labelled gauge; bools export as 0/1.
+                samples = [({"key": k}, +v) for k, v in value.items() if isinstance(v, (int, float))]
+            elif isinstance(value, (int, float)):
+                samples = [({}, +value)]
+            else:
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(_line(name, labels, v) for labels, v in samples)
+    return "\n".join(lines) + "\n"
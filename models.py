@@ -3,35 +3,35 @@ import os
 import asyncio
 from dotenv import load_dotenv
 import openai
-import google.generativeai as genai
-from google.generativeai.types import FunctionDeclaration, Tool
 
 # Import the centralized persona
 from persona import TIWA_PERSONA
+import metrics
+from gemini_client import GEMINI_API_KEY, load_genai
 
 load_dotenv()
 
 # --- API Client Configurations ---
+# Base URLs can be overridden to point at the local provider stubs in bench/.
 
 # OpenAI
 openai_client = openai.AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL"),
 )
 
 # Deepseek
 deepseek_client = openai.AsyncOpenAI(
     api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com",
+    base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
 )
 
-# Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Gemini is imported and configured on first use (see gemini_client.py).
 
 # --- Tool Definitions for Gemini ---
+# Plain keyword dicts; they become FunctionDeclarations when the decider is first built.
 
-tavily_web_search_tool = FunctionDeclaration(
+tavily_web_search_tool = dict(
     name="tavily_web_search",
     description="Searches the web for information. Use for questions about current events, facts, or things you don't know.",
     parameters={
@@ -43,7 +43,7 @@ tavily_web_search_tool = FunctionDeclaration(
     }
 )
 
-scrape_url_tool = FunctionDeclaration(
+scrape_url_tool = dict(
     name="scrape_url",
     description="Fetches and scrapes the text content from a URL. Use when a user provides a URL and asks for its content.",
     parameters={
@@ -55,7 +55,7 @@ scrape_url_tool = FunctionDeclaration(
     }
 )
 
-generate_image_tool = FunctionDeclaration(
+generate_image_tool = dict(
     name="generate_image",
     description="Creates an image from a text description. Use when the user asks to draw or generate an image.",
     parameters={
@@ -67,7 +67,7 @@ generate_image_tool = FunctionDeclaration(
     }
 )
 
-write_file_tool = FunctionDeclaration(
+write_file_tool = dict(
     name="write_file",
     description="Writes content to a file and returns a download link. Use to save code, text, or other content as a file.",
     parameters={
@@ -80,19 +80,19 @@ write_file_tool = FunctionDeclaration(
     }
 )
 
-read_document_tool = FunctionDeclaration(
+read_document_tool = dict(
     name="read_document",
     description="Reads the text content of a document (like a PDF or TXT file). Use this when a user uploads a document and asks a question about it.",
     parameters={
         "type": "object",
         "properties": {
-            "file_path": {"type": "string", "description": "The local path to the document file."}
+            "file_path": {"type": "string", "description": "The file id or local path of the uploaded document."}
         },
         "required": ["file_path"]
     }
 )
 
-build_project_tool = FunctionDeclaration(
+build_project_tool = dict(
     name="build_project",
     description="Starts a new software project build from a prompt. This orchestrator decomposes the prompt into subtasks, creates a project, and returns a project_id.",
     parameters={
@@ -104,7 +104,7 @@ build_project_tool = FunctionDeclaration(
     }
 )
 
-execute_next_task_tool = FunctionDeclaration(
+execute_next_task_tool = dict(
     name="execute_next_task",
     description="Executes the next pending subtask for a given project. When all tasks are complete, it will return a message indicating the project is ready for finalization.",
     parameters={
@@ -116,19 +116,20 @@ execute_next_task_tool = FunctionDeclaration(
     }
 )
 
-get_task_status_tool = FunctionDeclaration(
+get_task_status_tool = dict(
     name="get_task_status",
-    description="Gets the current status of a project build, including all subtasks and their states.",
+    description="Gets the current status of a project build, including all subtasks and their states. Progress is also pushed automatically, so prefer passing since_seq to fetch only what changed.",
     parameters={
         "type": "object",
         "properties": {
-            "project_id": {"type": "string", "description": "The ID of the project to get the status of."}
+            "project_id": {"type": "string", "description": "The ID of the project to get the status of."},
+            "since_seq": {"type": "integer", "description": "Optional. Only return progress events newer than this sequence number (the latest_seq from a previous call)."}
         },
         "required": ["project_id"]
     }
 )
 
-finalize_project_tool = FunctionDeclaration(
+finalize_project_tool = dict(
     name="finalize_project",
     description="Zips the completed project directory and provides a final download link. This is the last step after all tasks are executed.",
     parameters={
@@ -141,27 +142,63 @@ finalize_project_tool = FunctionDeclaration(
 )
 
 
+generate_scored_video_tool = dict(
+    name="generate_scored_video",
+    description="Creates a short video with a generated music soundtrack in one step. Use when the user wants a video with audio or music.",
+    parameters={
+        "type": "object",
+        "properties": {
+            "video_prompt": {"type": "string", "description": "A description of the video to generate."},
+            "audio_prompt": {"type": "string", "description": "A description of the music or soundtrack to generate."},
+            "output_filename": {"type": "string", "description": "Optional name for the final video file."}
+        },
+        "required": ["video_prompt", "audio_prompt"]
+    }
+)
+
+
 # --- AI Model Instances ---
 
+# Both are built on first use; they are None when GEMINI_API_KEY is not set.
+
 # 1. Tool Decider Model (Gemini)
-tool_decider_model = genai.GenerativeModel(
-    'gemini-flash-latest',
-    tools=[
-        tavily_web_search_tool, 
-        scrape_url_tool, 
-        generate_image_tool, 
-        write_file_tool, 
-        read_document_tool,
-        build_project_tool,
-        execute_next_task_tool,
-        get_task_status_tool,
-        finalize_project_tool
-    ]
-) if GEMINI_API_KEY else None
+DECIDER_TOOLS = [
+    tavily_web_search_tool, 
+    scrape_url_tool, 
+    generate_image_tool, 
+    write_file_tool, 
+    read_document_tool,
+    build_project_tool,
+    execute_next_task_tool,
+    get_task_status_tool,
+    finalize_project_tool,
+    generate_scored_video_tool
+]
+_tool_decider_model = None
+
+async def get_tool_decider_model():
+    """Returns the Gemini tool decider, building it (and importing the SDK) on first call."""
+    global _tool_decider_model
+    if _tool_decider_model is None and GEMINI_API_KEY:
+        genai = await load_genai()
+        from google.generativeai.types import FunctionDeclaration
+        _tool_decider_model = genai.GenerativeModel(
+            'gemini-flash-latest',
+            tools=[FunctionDeclaration(**declaration) for declaration in DECIDER_TOOLS]
+        )
+    return _tool_decider_model
 
 
 # 2. Judge Model (Gemini)
-judge_model = genai.GenerativeModel('gemini-flash-latest') if GEMINI_API_KEY else None
+_judge_model = None
+
+async def get_judge_model():
+    """Returns the Gemini judge model, building it on first call."""
+    global _judge_model
+    if _judge_model is None and GEMINI_API_KEY:
+        genai = await load_genai()
+        _judge_model = genai.GenerativeModel('gemini-flash-latest')
+    return _judge_model
 
 
 # --- TIWA Persona for Judge (Centralized) ---
@@ -189,10 +226,12 @@ TIWA_JUDGE_PROMPT = (
 async def call_gpt(prompt: str):
     """Calls the OpenAI GPT API."""
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        with metrics.stage("gpt", prompt_chars=len(prompt)) as span:
+            response = await openai_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}]
+            )
+            metrics.record_openai_usage("openai", response, span)
         return response.choices[0].message.content
     except Exception as e:
         return f"Error calling OpenAI API: {e}"
@@ -200,16 +239,19 @@ async def call_gpt(prompt: str):
 async def call_deepseek(prompt: str):
     """Calls the Deepseek API, requesting English output."""
     try:
-        response = await deepseek_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": f"Please answer in English. {prompt}"}]
-        )
+        with metrics.stage("deepseek", prompt_chars=len(prompt)) as span:
+            response = await deepseek_client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[{"role": "user", "content": f"Please answer in English. {prompt}"}]
+            )
+            metrics.record_openai_usage("deepseek", response, span)
         return response.choices[0].message.content
     except Exception as e:
         return f"Error calling Deepseek API: {e}"
 
 async def call_gemini_judge(candidate_outputs: list, evidence: list, prompt: str) -> str:
     """Uses Gemini to arbitrate between multiple candidate outputs."""
+    judge_model = await get_judge_model()
     if not judge_model:
         # Fallback to the first candidate if Gemini is not configured
         return candidate_outputs[0] if candidate_outputs else ""
@@ -229,7 +271,9 @@ async def call_gemini_judge(candidate_outputs: list, evidence: list, prompt: str
             f"{formatted_candidates}"
         )
 
-        response = await asyncio.to_thread(judge_model.generate_content, judge_prompt_full)
+        with metrics.stage("judge", prompt_chars=len(judge_prompt_full), candidates=len(candidate_outputs)) as span:
+            response = await asyncio.to_thread(judge_model.generate_content, judge_prompt_full)
+            metrics.record_gemini_usage("gemini_judge", response, span)
         return response.text.strip()
     except Exception as e:
         # Fallback to the first candidate in case of an error
@@ -1,12 +1,16 @@
 
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 import asyncio
 import uuid
-import subprocess
-import replicate
-import requests # To download generated files
+
+import downloader
+import media_analysis
+import ffmpeg_jobs
+import upload_store
+import storage
+import tracing
+from gemini_client import GEMINI_API_KEY
 
 # Load environment variables
 load_dotenv()
@@ -16,26 +20,60 @@ os.makedirs("static", exist_ok=True)
 os.makedirs("uploads", exist_ok=True)
 
 # --- API Key Configurations ---
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-# Replicate API Token
+# Gemini is configured on first use by gemini_client; the replicate package is imported
+# on first prediction and reads REPLICATE_API_TOKEN itself.
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
-if REPLICATE_API_TOKEN:
-    replicate.Client(api_token=REPLICATE_API_TOKEN)
+
+# Replicate models used for generation.
+VIDEO_MODEL_VERSION = "anotherjesse/zeroscope-v2-xl:9f747673945c62801b13b847043705120c97377cd5c2257405c20a3cc856e86f"
+AUDIO_MODEL_VERSION = "meta/musicgen:b05b1dff1d8c6dc63d14b0cdb42135378dcb87f6373b0d3d341ede46e59e2b38"
+
+def video_model_input(prompt: str) -> dict:
+    return {"prompt": prompt}
+
+def audio_model_input(prompt: str) -> dict:
+    return {
+        "model_version": "stereo-melody-large",
+        "prompt": prompt,
+        "output_format": "mp3",
+        "duration": 10, # Keep it short for faster generation
+    }
+
+# --- Helper Function to Run Replicate Predictions ---
+async def run_prediction(model_version: str, model_input: dict) -> str:
+    """
+    Runs a Replicate prediction through the async API, polling with exponential backoff,
+    and returns its output URL. The prediction is cancelled if the caller is cancelled.
+    """
+    import replicate  # Deferred: only needed once something is generated.
+    _, _, version_id = model_version.partition(":")
+    with tracing.span("replicate_prediction", model=version_id[:12]) as span:
+        prediction = await replicate.predictions.async_create(version=version_id, input=model_input)
+
+        delay, polls = 1.0, 0
+        try:
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, 10.0)
+                await prediction.async_reload()
+                polls += 1
+        except asyncio.CancelledError:
+            await prediction.async_cancel()
+            raise
+        span.set(status=prediction.status, polls=polls)
+
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Prediction {prediction.status}: {prediction.error}")
+        output = prediction.output
+        return str(output[0] if isinstance(output, list) else output)
 
 # --- Helper Function to Download Files ---
-def download_file_from_url(url: str, save_path: str) -> bool:
-    """Downloads a file from a URL and saves it locally."""
+async def download_file_from_url(url: str, save_path: str) -> bool:
+    """Downloads a file from a URL and saves it locally, without blocking the event loop."""
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        await downloader.download(str(url), save_path)
         return True
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         print(f"Error downloading file from {url}: {e}", flush=True)
         return False
 
@@ -43,47 +81,22 @@ def download_file_from_url(url: str, save_path: str) -> bool:
 async def analyze_media(file_path: str) -> str:
     """
     Analyzes a video or audio file using the Gemini multimodal model.
+    Remote uploads and results are reused for identical files (see media_analysis.py).
     """
-    # ... (rest of the function remains the same)
     if not GEMINI_API_KEY:
         return "Error: GEMINI_API_KEY is not configured. Media analysis is disabled."
 
+    file_path = upload_store.resolve_path(file_path) if upload_store.get_upload(file_path) else file_path
+    if not os.path.exists(file_path):
+        return f"Error: Media file '{os.path.basename(file_path)}' not found."
+
     try:
         print(f"Analyzing media file: {file_path}", flush=True)
-        
-        media_file = genai.upload_file(path=file_path)
-
-        while media_file.state.name == "PROCESSING":
-            await asyncio.sleep(2) 
-            media_file = genai.get_file(media_file.name)
-        
-        if media_file.state.name == "FAILED":
-            return f"Error: Media file processing failed. Reason: {media_file.state.name}"
-        
-        mime_type = media_file.mime_type
-        if "video" in mime_type:
-            prompt = "Describe the contents of this video in detail."
-        elif "audio" in mime_type:
-            prompt = "Transcribe the speech in this audio file."
-        else:
-            genai.delete_file(media_file.name)
-            return f"Error: Unsupported file type for analysis: {mime_type}"
-
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        response = await asyncio.to_thread(model.generate_content, [prompt, media_file])
-
-        genai.delete_file(media_file.name)
-        
-        return response.text.strip()
-
+        return await media_analysis.analyze(file_path)
+    except media_analysis.MediaAnalysisError as e:
+        return f"Error: {e}"
     except Exception as e:
         print(f"Error during media analysis for {file_path}: {e}", flush=True)
-        try:
-            if 'media_file' in locals() and media_file:
-                genai.delete_file(media_file.name)
-        except Exception as cleanup_e:
-            print(f"Nested error during cleanup: {cleanup_e}", flush=True)
-            
         return f"An unexpected error occurred during media analysis: {e}"
 
 async def generate_video(prompt: str) -> str:
@@ -95,19 +108,16 @@ async def generate_video(prompt: str) -> str:
 
     print(f"Generating video for prompt: '{prompt}'", flush=True)
     try:
-        output_url = await asyncio.to_thread(
-            replicate.run,
-            "anotherjesse/zeroscope-v2-xl:9f747673945c62801b13b847043705120c97377cd5c2257405c20a3cc856e86f",
-            input={"prompt": prompt}
-        )
+        output_url = await run_prediction(VIDEO_MODEL_VERSION, video_model_input(prompt))
         
         filename = f"video_{uuid.uuid4()}.mp4"
-        filepath = os.path.join("static", filename)
+        filepath = storage.shard_path("static", filename)
         
-        if not download_file_from_url(output_url, filepath):
+        if not await download_file_from_url(output_url, filepath):
             return "Error: Failed to download the generated video."
+        storage.register(filepath)
 
-        url_path = f"/static/{filename}"
+        url_path = f"/{filepath}"
         print(f"Video generated successfully. File at: {url_path}", flush=True)
         return url_path
 
@@ -123,24 +133,16 @@ async def generate_audio(prompt: str) -> str:
 
     print(f"Generating audio for prompt: '{prompt}'", flush=True)
     try:
-        output_url = await asyncio.to_thread(
-            replicate.run,
-            "meta/musicgen:b05b1dff1d8c6dc63d14b0cdb42135378dcb87f6373b0d3d341ede46e59e2b38",
-            input={
-                "model_version": "stereo-melody-large",
-                "prompt": prompt,
-                "output_format": "mp3",
-                "duration": 10, # Keep it short for faster generation
-            }
-        )
+        output_url = await run_prediction(AUDIO_MODEL_VERSION, audio_model_input(prompt))
 
         filename = f"audio_{uuid.uuid4()}.mp3"
-        filepath = os.path.join("static", filename)
+        filepath = storage.shard_path("static", filename)
 
-        if not download_file_from_url(output_url, filepath):
+        if not await download_file_from_url(output_url, filepath):
             return "Error: Failed to download the generated audio."
+        storage.register(filepath)
 
-        url_path = f"/static/{filename}"
+        url_path = f"/{filepath}"
         print(f"Audio generated successfully. File at: {url_path}", flush=True)
         return url_path
 
@@ -169,7 +171,7 @@ async def combine_media(video_path: str, audio_path: str, output_filename: str =
         # Basic sanitization
         output_filename = "".join(c for c in output_filename if c.isalnum() or c in ('.', '_')).rstrip()
 
-    output_filepath = os.path.join("static", output_filename)
+    output_filepath = storage.shard_path("static", output_filename)
 
     # Construct FFmpeg command
     command = [
@@ -184,16 +186,48 @@ async def combine_media(video_path: str, audio_path: str, output_filename: str =
     ]
 
     try:
-        process = await asyncio.to_thread(
-            subprocess.run, command, check=True, capture_output=True, text=True
-        )
-        print("FFmpeg stdout:", process.stdout)
+        duration = await ffmpeg_jobs.probe_duration(video_filepath)
+        await ffmpeg_jobs.run(command, duration=duration, label="Combining video and audio")
     except FileNotFoundError:
         return "Error: `ffmpeg` command not found. Please ensure FFmpeg is installed and accessible in the system's PATH."
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg stderr:", e.stderr)
-        return f"Error during media combination with FFmpeg: {e.stderr}"
+    except ffmpeg_jobs.FFmpegError as e:
+        print("FFmpeg stderr:", e)
+        return f"Error during media combination with FFmpeg: {e}"
 
-    url_path = f"/static/{output_filename}"
+    storage.register(output_filepath)
+    url_path = f"/{output_filepath}"
     print(f"Media combination complete. Final file at: {url_path}", flush=True)
     return f"Successfully combined video and audio. The final video is available at: {url_path}"
+
+async def generate_scored_video(video_prompt: str, audio_prompt: str, output_filename: str = None) -> str:
+    """
+    Generates a video and its soundtrack concurrently and combines them into one file.
+    Both Replicate predictions run at the same time; each result is downloaded as soon as
+    its prediction finishes, and the combine step starts once both files are on disk.
+    """
+    if not REPLICATE_API_TOKEN:
+        return "Error: REPLICATE_API_TOKEN is not configured. Video generation is disabled."
+
+    print(f"Generating scored video. Video: '{video_prompt}', audio: '{audio_prompt}'", flush=True)
+
+    async def produce(kind: str, model_version: str, model_input: dict, extension: str) -> str:
+        output_url = await run_prediction(model_version, model_input)
+        filepath = storage.shard_path("static", f"{kind}_{uuid.uuid4()}.{extension}")
+        if not await download_file_from_url(output_url, filepath):
+            raise RuntimeError(f"Failed to download the generated {kind}.")
+        storage.register(filepath)
+        return f"/{filepath}"
+
+    video_task = asyncio.create_task(produce("video", VIDEO_MODEL_VERSION, video_model_input(video_prompt), "mp4"))
+    audio_task = asyncio.create_task(produce("audio", AUDIO_MODEL_VERSION, audio_model_input(audio_prompt), "mp3"))
+    try:
+        video_url_path, audio_url_path = await asyncio.gather(video_task, audio_task)
+    except BaseException as e:
+        # One side failed (or we were cancelled): stop the other prediction too.
+        video_task.cancel()
+        audio_task.cancel()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return f"An error occurred during scored video generation: {e}"
+
+    return await combine_media(video_url_path, audio_url_path, output_filename)
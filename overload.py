@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+
+import metrics
+import prompt_scheduler
+
+# Load-aware degradation.
+# A background task turns three signals into one load score, where 1.0 means a signal has
+# reached its limit:
+#   - event-loop lag (smoothed), against OVERLOAD_LAG_SECONDS
+#   - prompts in flight in this worker, against OVERLOAD_INFLIGHT_PROMPTS
+#   - provider calls in flight (GPT, DeepSeek, decider, judge), against OVERLOAD_PROVIDER_CALLS
+# The score selects a tier, and each tier sheds more work per prompt:
+#   0 normal        full pipeline
+#   1 skip_judge    consensus without Gemini arbitration
+#   2 single_model  GPT only, no fan-out or consensus
+#   3 refuse        new prompts are rejected with a retry_after hint
+# Escalation is immediate. Recovery drops one tier at a time, and only after the score
+# has stayed below OVERLOAD_RECOVERY_RATIO of the current tier's threshold for
+# OVERLOAD_RECOVERY_SECONDS, so the tier does not flap around a threshold.
+
+OVERLOAD_CONTROL = os.getenv("OVERLOAD_CONTROL", "1") == "1"
+OVERLOAD_INTERVAL = float(os.getenv("OVERLOAD_INTERVAL", "0.5"))
+OVERLOAD_LAG_SECONDS = float(os.getenv("OVERLOAD_LAG_SECONDS", "0.1"))
+OVERLOAD_INFLIGHT_PROMPTS = int(os.getenv("OVERLOAD_INFLIGHT_PROMPTS", "64"))
+OVERLOAD_PROVIDER_CALLS = int(os.getenv("OVERLOAD_PROVIDER_CALLS", "128"))
+OVERLOAD_RECOVERY_RATIO = float(os.getenv("OVERLOAD_RECOVERY_RATIO", "0.7"))
+OVERLOAD_RECOVERY_SECONDS = float(os.getenv("OVERLOAD_RECOVERY_SECONDS", "10"))
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "5"))
+
+NORMAL, SKIP_JUDGE, SINGLE_MODEL, REFUSE = 0, 1, 2, 3
+TIER_NAMES = ("normal", "skip_judge", "single_model", "refuse")
+# Load score at which each tier is entered.
+TIER_THRESHOLDS = (0.0, 1.0, 1.5, 2.0)
+
+PROVIDER_STAGES = ("gpt", "deepseek", "decider", "judge")
+# Weight of the newest lag sample in the moving average.
+LAG_SMOOTHING = 0.3
+
+state = {"tier": NORMAL, "score": 0.0, "lag_seconds": 0.0, "inflight_prompts": 0, "provider_calls": 0,
+         "seconds_in_tier": 0.0}
+
+tier_transitions = metrics.counter("overload_tier_transitions", "Degradation tier changes.", ("from_tier", "to_tier"))
+tier_seconds = metrics.counter("overload_tier_seconds", "Time spent in each degradation tier.", ("tier",))
+metrics.register_stats("overload", state)
+
+_tier_since = time.monotonic()
+_calm_since: float | None = None
+
+
+def tier() -> int:
+    return state["tier"] if OVERLOAD_CONTROL else NORMAL
+
+def tier_name() -> str:
+    return TIER_NAMES[tier()]
+
+def retry_after() -> int:
+    """Seconds a refused client should wait before sending the prompt again."""
+    return OVERLOAD_RETRY_AFTER
+
+def load_score() -> float:
+    return max(state["lag_seconds"] / OVERLOAD_LAG_SECONDS,
+               state["inflight_prompts"] / OVERLOAD_INFLIGHT_PROMPTS,
+               state["provider_calls"] / OVERLOAD_PROVIDER_CALLS)
+
+def _set_tier(new_tier: int, now: float):
+    global _tier_since
+    old_tier = state["tier"]
+    tier_transitions.inc(from_tier=TIER_NAMES[old_tier], to_tier=TIER_NAMES[new_tier])
+    state["tier"] = new_tier
+    _tier_since = now
+    print(f"Overload tier {TIER_NAMES[old_tier]} -> {TIER_NAMES[new_tier]} (load score {state['score']:.2f}).", flush=True)
+
+def evaluate(now: float):
+    """Samples the load signals and moves between tiers. Called every OVERLOAD_INTERVAL."""
+    global _calm_since
+    state["lag_seconds"] += LAG_SMOOTHING * (metrics.loop_stats["lag_seconds"] - state["lag_seconds"])
+    state["inflight_prompts"] = prompt_scheduler.stats["inflight"]
+    state["provider_calls"] = sum(metrics.stage_inflight.get(name, 0) for name in PROVIDER_STAGES)
+    score = state["score"] = load_score()
+    state["seconds_in_tier"] = now - _tier_since
+
+    target = max(t for t, threshold in enumerate(TIER_THRESHOLDS) if score >= threshold)
+    current = state["tier"]
+    if target > current:
+        _calm_since = None
+        _set_tier(target, now)
+    elif current > NORMAL and score < TIER_THRESHOLDS[current] * OVERLOAD_RECOVERY_RATIO:
+        if _calm_since is None:
+            _calm_since = now
+        elif now - _calm_since >= OVERLOAD_RECOVERY_SECONDS:
+            _calm_since = now  # The next step down needs its own calm period.
+            _set_tier(current - 1, now)
+    else:
+        _calm_since = None
+
+async def run_overload_controller():
+    """Re-evaluates the degradation tier every OVERLOAD_INTERVAL seconds. Run it as a background task."""
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(OVERLOAD_INTERVAL)
+        now = time.monotonic()
+        tier_seconds.inc(now - last, tier=TIER_NAMES[state["tier"]])
+        last = now
+        evaluate(now)
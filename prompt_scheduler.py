@@ -0,0 +1,222 @@
+import os
+import time
+import asyncio
+from collections import deque, OrderedDict
+
+# Per-chat prompt scheduling and resumable sessions.
+# Each chat session owns one PromptScheduler. It keeps a reference to every in-flight
+# prompt task, refuses new prompts beyond MAX_INFLIGHT_PROMPTS, serializes frames onto
+# the socket, and cancels outstanding work (GPT/DeepSeek/judge calls, tools) when the
+# client asks for it or the session expires. Cancelled work is counted in `stats`.
+#
+# Every outbound frame gets a `frame_seq` and is kept in a bounded buffer. When the socket
+# drops, prompts keep running and their frames are buffered; a client that reconnects
+# with its chat id and last seen frame_seq within SESSION_GRACE_SECONDS gets the missed
+# frames replayed and stays attached to the running work. Otherwise the session expires
+# and its prompts are cancelled.
+
+MAX_INFLIGHT_PROMPTS = int(os.getenv("MAX_INFLIGHT_PROMPTS", "4"))
+SESSION_BUFFER_FRAMES = int(os.getenv("SESSION_BUFFER_FRAMES", "256"))
+SESSION_GRACE_SECONDS = float(os.getenv("SESSION_GRACE_SECONDS", "30"))
+
+stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "inflight": 0,
+         "cancelled_by_client": 0, "cancelled_on_disconnect": 0,
+         # Seconds of work already spent on prompts when they were cancelled.
+         "cancelled_seconds": 0.0,
+         # Frames that could not be sent live (kept in the buffer for replay while it lasts).
+         "frames_dropped": 0,
+         "sessions": 0, "sessions_resumed": 0, "sessions_expired": 0, "frames_replayed": 0,
+         # Resumes that asked for frames already evicted from the buffer.
+         "replay_gaps": 0,
+         # Prompts re-sent with an id the session already ran; answered by replay, not re-run.
+         "duplicate_prompts": 0}
+
+sessions: dict = {}  # chat_id -> PromptScheduler
+
+
+class PromptScheduler:
+    """Tracks, bounds and cancels the prompt tasks of one chat session, across reconnects."""
+
+    def __init__(self, chat_id: str, client_id: str):
+        self.chat_id = chat_id
+        self.client_id = client_id
+        self.websocket = None
+        self.closed = False
+        # Event-bus listener whose events are forwarded to this session as progress frames.
+        self.progress_listener = None
+        # Called once when the session expires, after its prompts are cancelled.
+        self.on_close: list = []
+        self.frame_seq = 0
+        self._frames: deque = deque(maxlen=SESSION_BUFFER_FRAMES)
+        self._send_lock = asyncio.Lock()
+        self._tasks: dict = {}   # prompt_id -> asyncio.Task
+        self._started: dict = {}  # prompt_id -> perf_counter at submit
+        self._cancelling: set = set()
+        self._prompt_ids: OrderedDict = OrderedDict()  # Recently submitted ids, oldest first.
+        self._expiry_task = None
+
+    async def send_json(self, frame: dict) -> bool:
+        """
+        Numbers, buffers and sends one frame; frames from concurrent prompts never interleave.
+        Returns False when the client is not attached (the frame is still buffered) or the session is closed.
+        """
+        if self.closed:
+            stats["frames_dropped"] += 1
+            return False
+        async with self._send_lock:
+            self.frame_seq += 1
+            frame = {**frame, "frame_seq": self.frame_seq}
+            self._frames.append(frame)
+            if self.websocket is None:
+                stats["frames_dropped"] += 1
+                return False
+            try:
+                await self.websocket.send_json(frame)
+                return True
+            except Exception:
+                # The receive loop notices the disconnect and detaches; until then frames are only buffered.
+                stats["frames_dropped"] += 1
+                return False
+
+    async def attach(self, websocket, last_frame_seq: int | None = None):
+        """
+        Makes `websocket` the session's connection. Sends a `session` frame, then replays every
+        buffered frame after `last_frame_seq` in order. A connection still attached is closed.
+        """
+        if self._expiry_task:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+        async with self._send_lock:
+            previous, self.websocket = self.websocket, websocket
+            if previous is not None:
+                try:
+                    await previous.close(code=4000, reason="Session resumed elsewhere")
+                except Exception:
+                    pass
+            resumed = last_frame_seq is not None
+            replay = [frame for frame in self._frames if frame["frame_seq"] > last_frame_seq] if resumed else []
+            oldest = self._frames[0]["frame_seq"] if self._frames else self.frame_seq + 1
+            gap = resumed and last_frame_seq + 1 < oldest
+            if resumed:
+                stats["sessions_resumed"] += 1
+                stats["frames_replayed"] += len(replay)
+                stats["replay_gaps"] += gap
+            try:
+                await websocket.send_json({"type": "session", "chat_id": self.chat_id, "resumed": resumed,
+                                           "frame_seq": self.frame_seq, "replayed": len(replay), "gap": gap,
+                                           "inflight": list(self._tasks)})
+                for frame in replay:
+                    await websocket.send_json(frame)
+            except Exception:
+                stats["frames_dropped"] += 1
+
+    def detach(self, websocket):
+        """Called when `websocket` disconnects; the session expires unless resumed within the grace period."""
+        if self.websocket is not websocket or self.closed:
+            return
+        self.websocket = None
+        self._expiry_task = asyncio.create_task(self._expire_after(SESSION_GRACE_SECONDS))
+
+    async def _expire_after(self, delay: float):
+        await asyncio.sleep(delay)
+        self._expiry_task = None
+        stats["sessions_expired"] += 1
+        await self.close()
+
+    async def close(self) -> int:
+        """Ends the session: cancels its prompts, runs `on_close` callbacks and forgets it."""
+        if sessions.get(self.chat_id) is self:
+            del sessions[self.chat_id]
+            stats["sessions"] = len(sessions)
+        cancelled = await self.cancel_all()
+        if cancelled:
+            print(f"Cancelled {cancelled} in-flight prompt(s) for chat {self.chat_id}.", flush=True)
+        for callback in self.on_close:
+            callback()
+        self.on_close.clear()
+        self._frames.clear()
+        return cancelled
+
+    def seen_prompt(self, prompt_id: str) -> bool:
+        """True if this session already ran (or is running) `prompt_id`; its frames are replayed, not recomputed."""
+        return prompt_id in self._prompt_ids
+
+    def answer_lost(self, prompt_id: str) -> bool:
+        """
+        True if `prompt_id` is no longer running and its final, error or cancelled frame has left
+        the buffer, so neither live frames nor a replay can deliver its outcome.
+        """
+        return prompt_id not in self._tasks and not any(
+            frame.get("prompt_id") == prompt_id and frame["type"] in ("final", "error", "cancelled")
+            for frame in self._frames)
+
+    def submit(self, prompt_id: str, coro) -> bool:
+        """
+        Starts a prompt task. Returns False (and closes the coroutine) when the connection
+        already has MAX_INFLIGHT_PROMPTS outstanding or the prompt id is in use.
+        """
+        if len(self._tasks) >= MAX_INFLIGHT_PROMPTS or prompt_id in self._tasks:
+            coro.close()
+            stats["rejected"] += 1
+            return False
+        task = asyncio.create_task(coro)
+        self._tasks[prompt_id] = task
+        self._prompt_ids[prompt_id] = None
+        while len(self._prompt_ids) > SESSION_BUFFER_FRAMES:
+            self._prompt_ids.popitem(last=False)
+        self._started[prompt_id] = time.perf_counter()
+        stats["submitted"] += 1
+        stats["inflight"] += 1
+        task.add_done_callback(lambda t: self._finished(prompt_id, t))
+        return True
+
+    def _finished(self, prompt_id: str, task: asyncio.Task):
+        self._tasks.pop(prompt_id, None)
+        started = self._started.pop(prompt_id, None)
+        self._cancelling.discard(prompt_id)
+        stats["inflight"] -= 1
+        if task.cancelled():
+            if started is not None:
+                stats["cancelled_seconds"] += time.perf_counter() - started
+        elif task.exception() is not None:
+            stats["failed"] += 1
+            print(f"Prompt {prompt_id} for client {self.client_id} failed: {task.exception()}", flush=True)
+        else:
+            stats["completed"] += 1
+
+    def cancel(self, prompt_id: str) -> bool:
+        """Cancels one prompt at the client's request. Returns False if it is not running."""
+        task = self._tasks.get(prompt_id)
+        if task is None or task.done() or prompt_id in self._cancelling:
+            return False
+        self._cancelling.add(prompt_id)
+        task.cancel()
+        stats["cancelled_by_client"] += 1
+        return True
+
+    async def cancel_all(self) -> int:
+        """Cancels every in-flight prompt (e.g. on session expiry) and waits for them to unwind."""
+        self.closed = True
+        tasks = [task for prompt_id, task in self._tasks.items()
+                 if not task.done() and prompt_id not in self._cancelling]
+        for task in tasks:
+            task.cancel()
+        pending = list(self._tasks.values())
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        stats["cancelled_on_disconnect"] += len(tasks)
+        return len(tasks)
+
+
+def open_session(chat_id: str, client_id: str) -> PromptScheduler:
+    """Creates and registers the scheduler for a new chat session."""
+    scheduler = sessions[chat_id] = PromptScheduler(chat_id, client_id)
+    stats["sessions"] = len(sessions)
+    return scheduler
+
+def get_session(chat_id: str, client_id: str) -> PromptScheduler | None:
+    """Returns a live session to resume, only for the client that opened it."""
+    scheduler = sessions.get(chat_id)
+    if scheduler is None or scheduler.closed or scheduler.client_id != client_id:
+        return None
+    return scheduler
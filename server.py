@@ -1,17 +1,16 @@
 
 import asyncio
+import time
 import uuid
 import re
 import os
-import shutil
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from typing import Dict, Optional
 
 # Import from our modules
-from chat_memory import create_chat_session, add_message_to_session, get_formatted_history
-from models import call_gpt, call_deepseek, tool_decider_model
+from chat_memory import create_chat_session, get_chat_session, add_message_to_session, get_formatted_history
+from models import call_gpt, call_deepseek, get_tool_decider_model
 from consensus import verify_and_merge
 from tools import (
     tavily_web_search, 
@@ -25,8 +24,28 @@ from tools import (
     get_task_status,   # New import
     finalize_project   # New import
 )
-from multimedia_tools import analyze_media, generate_video, generate_audio, combine_media
+from multimedia_tools import analyze_media, generate_video, generate_audio, combine_media, generate_scored_video
 from persona import TIWA_PERSONA
+from tasks import get_task, project_topic
+import events
+from zipstream import stream_zip
+import upload_store
+from static_cache import CachedStaticFiles, serve_file, REVALIDATE_CACHE_CONTROL
+import storage
+import downloader
+import ffmpeg_jobs
+import prompt_scheduler
+from prompt_scheduler import PromptScheduler, MAX_INFLIGHT_PROMPTS
+import metrics
+import tracing
+import warmup
+import embedding_service
+import overload
+import artifacts
+import media_analysis
+import transcode
+import image_variants
+import static_cache
 
 app = FastAPI()
 
@@ -36,8 +55,42 @@ os.makedirs("generated_files", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
 # --- Static File Mounts ---
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/downloads", StaticFiles(directory="generated_files"), name="downloads")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+app.mount("/downloads", CachedStaticFiles(directory="generated_files"), name="downloads")
+
+# URL prefix -> directory, for recording artifact accesses with the storage manager.
+TRACKED_MOUNTS = {"/static/": "static", "/downloads/": "generated_files"}
+
+@app.middleware("http")
+async def track_artifact_access(request: Request, call_next):
+    """Marks served artifacts as recently used so LRU eviction keeps them."""
+    path = request.url.path
+    for prefix, directory in TRACKED_MOUNTS.items():
+        if path.startswith(prefix):
+            storage.touch(os.path.join(directory, path[len(prefix):]))
+            break
+    return await call_next(request)
+
+@app.on_event("startup")
+async def start_storage_manager():
+    app.state.storage_task = asyncio.create_task(storage.run_storage_manager())
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    app.state.loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+
+@app.on_event("startup")
+async def start_overload_controller():
+    app.state.overload_task = asyncio.create_task(overload.run_overload_controller())
+
+@app.on_event("startup")
+async def start_warmup():
+    # Heavy SDKs and models load lazily; TIWA_WARMUP=1 preloads them in the background.
+    app.state.warmup_task = warmup.start()
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    await downloader.close()
 
 
 # --- File & Security Operations ---
@@ -48,25 +101,41 @@ def sanitize_filename(filename: str) -> str:
     sanitized = re.sub(r'[^a-zA-Z0-9._-]', '', sanitized)
     return sanitized if sanitized else "sanitized_default_name"
 
-@app.post("/uploadfile/")
-async def create_upload_file(file: UploadFile = File(...)):
-    """Handles file uploads, sanitizes the filename, and saves it."""
-    sanitized_filename = sanitize_filename(file.filename)
-    upload_path = os.path.join("uploads", sanitized_filename)
+async def store_upload(chunks, filename: str, content_type: str = None, expected_size: int = None) -> JSONResponse:
+    """Streams an upload into the content-addressed upload store and builds the API response."""
+    sanitized_filename = sanitize_filename(filename or "")
 
     try:
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        file_info = {"filename": sanitized_filename, "path": upload_path}
-        
+        record = await upload_store.save_stream(chunks, sanitized_filename, content_type, expected_size)
+        file_info = {
+            "file_id": record["file_id"],
+            "filename": sanitized_filename,
+            "path": record["path"],
+            "size": record["size"],
+            "deduplicated": record["deduplicated"],
+        }
+
         return JSONResponse(status_code=200, content={
             "message": "File uploaded successfully",
             "file_info": file_info
         })
+    except upload_store.UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"message": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"Could not upload file: {e}"})
 
+@app.post("/uploadfile/")
+async def create_upload_file(file: UploadFile = File(...)):
+    """Handles multipart file uploads, sanitizes the filename, and stores it."""
+    return await store_upload(upload_store.iter_upload_file(file), file.filename, file.content_type, file.size)
+
+@app.post("/uploads")
+async def stream_upload_file(request: Request, filename: str):
+    """Handles raw-body uploads, streaming the request straight to disk as it arrives."""
+    content_length = request.headers.get("content-length")
+    expected_size = int(content_length) if content_length and content_length.isdigit() else None
+    return await store_upload(request.stream(), filename, request.headers.get("content-type"), expected_size)
+
 
 # --- Core Identity & Business Logic ---
 
@@ -86,7 +155,8 @@ def generate_topic(prompt: str) -> str:
     return topic
 
 # --- Available Tools ---
-AVAILABLE_TOOLS = {
+# Every tool is wrapped so its calls are timed and counted in /metrics.
+AVAILABLE_TOOLS = {name: metrics.instrument_tool(name, function) for name, function in {
     "tavily_web_search": tavily_web_search,
     "scrape_url": scrape_url,
     "generate_image": generate_image,
@@ -95,6 +165,7 @@ AVAILABLE_TOOLS = {
     "generate_video": generate_video,
     "generate_audio": generate_audio,
     "combine_media": combine_media,
+    "generate_scored_video": generate_scored_video,
     "build_project": build_project,
     "zip_directory": zip_directory,
     "read_document": read_document,
@@ -102,99 +173,280 @@ AVAILABLE_TOOLS = {
     "execute_next_task": execute_next_task,
     "get_task_status": get_task_status,
     "finalize_project": finalize_project,
-}
+}.items()}
+
+# Module counters exported as gauges in /metrics.
+for _name, _stats in {
+    "prompt_scheduler": prompt_scheduler.stats,
+    "downloader": downloader.stats,
+    "artifacts": artifacts.stats,
+    "storage": storage.stats,
+    "ffmpeg_jobs": ffmpeg_jobs.stats,
+    "transcode": transcode.stats,
+    "media_analysis": media_analysis.stats,
+    "image_variants": image_variants.stats,
+    "static_cache": static_cache.stats,
+    "embedding_client": embedding_service.stats,
+}.items():
+    metrics.register_stats(_name, _stats)
 
 # --- Main Prompt Processing Logic ---
 
-async def process_single_prompt(websocket: WebSocket, chat_id: str, prompt: str, prompt_id: str, file_path: Optional[str] = None):
+async def process_single_prompt(scheduler: PromptScheduler, chat_id: str, prompt: str, prompt_id: str, file_path: Optional[str] = None, file_id: Optional[str] = None):
     """Handles prompts dynamically, including context from uploaded files (text, audio, or video)."""
-    try:
-        if is_identity_question(prompt):
-            # ... (identity logic remains the same)
-            return
-
-        add_message_to_session(chat_id, "user", prompt)
-        topic = generate_topic(prompt)
-        await websocket.send_json({"type": "thinking", "topic": topic, "prompt_id": prompt_id})
-
-        file_content_context = ""
-        MEDIA_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.wav', '.mp3', '.flac', '.aac'}
+    started = time.perf_counter()
+    outcome = "error"
+    # Everything below is recorded as one span tree when the prompt is sampled for tracing.
+    # The degradation tier is read once so a prompt is handled consistently end to end.
+    tier = overload.tier()
+    with tracing.start_trace(prompt_id, chat_id=chat_id, prompt_chars=len(prompt), overload_tier=overload.TIER_NAMES[tier]) as trace:
+        try:
+            if is_identity_question(prompt):
+                # ... (identity logic remains the same)
+                outcome = "identity"
+                return
+
+            add_message_to_session(chat_id, "user", prompt)
+            topic = generate_topic(prompt)
+            await scheduler.send_json({"type": "thinking", "topic": topic, "prompt_id": prompt_id})
+
+            file_content_context = ""
+            MEDIA_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.wav', '.mp3', '.flac', '.aac'}
         
-        if file_path:
-            _, ext = os.path.splitext(file_path)
-            if ext.lower() in MEDIA_EXTENSIONS:
-                # For media files, provide a system note to the AI to use the analysis tool.
-                file_content_context = f"\n\n[System note: A media file has been uploaded. Path: '{file_path}'. To understand its content, use the 'analyze_media' tool with this path.]\n"
-            else:
-                # For text-based files, provide a system note to the AI to use the analysis tool.
-                file_content_context = f"\n\n[System note: A document has been uploaded. Path: '{file_path}'. To understand its content, use the 'read_document' tool with this path.]\n"
-
-        history = get_formatted_history(chat_id)
-        contextual_prompt = f"{history}{file_content_context}\nUser's current question: {prompt}"
-
-        function_call = None
-        tool_executed = False
-
-        if tool_decider_model:
-            decision_response = await asyncio.to_thread(tool_decider_model.generate_content, contextual_prompt)
-            try:
-                _ = decision_response.text
-            except ValueError:
+            if file_id and not file_path:
+                file_path = upload_store.resolve_path(file_id)
+
+            if file_path:
+                # Refer to stored uploads by their stable file id; tools resolve it without re-reading the bytes.
+                file_ref = file_id or upload_store.file_id_for_path(file_path) or file_path
+                _, ext = os.path.splitext(file_path)
+                if ext.lower() in MEDIA_EXTENSIONS:
+                    # For media files, provide a system note to the AI to use the analysis tool.
+                    file_content_context = f"\n\n[System note: A media file has been uploaded. Path: '{file_ref}'. To understand its content, use the 'analyze_media' tool with this path.]\n"
+                else:
+                    # For text-based files, provide a system note to the AI to use the analysis tool.
+                    file_content_context = f"\n\n[System note: A document has been uploaded. Path: '{file_ref}'. To understand its content, use the 'read_document' tool with this path.]\n"
+
+            history = get_formatted_history(chat_id)
+            contextual_prompt = f"{history}{file_content_context}\nUser's current question: {prompt}"
+
+            function_call = None
+            tool_executed = False
+
+            tool_decider_model = await get_tool_decider_model()
+            if tool_decider_model:
+                with metrics.stage("decider", prompt_chars=len(contextual_prompt)) as span:
+                    decision_response = await asyncio.to_thread(tool_decider_model.generate_content, contextual_prompt)
+                    metrics.record_gemini_usage("gemini_decider", decision_response, span)
                 try:
-                    function_call = decision_response.candidates[0].content.parts[0].function_call
-                except Exception:
-                    pass
-
-        if function_call:
-            tool_name = function_call.name
-            if tool_name in AVAILABLE_TOOLS:
-                tool_args = {key: value for key, value in function_call.args.items()}
-                tool_function = AVAILABLE_TOOLS[tool_name]
-                tool_result = await tool_function(**tool_args)
-                add_message_to_session(chat_id, "assistant", tool_result, reasoning=f"Direct result from {tool_name}")
-                await websocket.send_json({"type": "final", "prompt_id": prompt_id, "final_source": tool_result})
-                tool_executed = True
-
-        if not tool_executed:
-            gpt_task = asyncio.create_task(call_gpt(contextual_prompt))
-            deepseek_task = asyncio.create_task(call_deepseek(contextual_prompt))
-            gpt_result, deepseek_result = await asyncio.gather(gpt_task, deepseek_task)
-
-            model_outputs = {"gpt": gpt_result, "deepseek": deepseek_result}
-            final_data = await verify_and_merge(outputs=model_outputs, evidence=[deepseek_result], prompt=contextual_prompt)
-
-            add_message_to_session(chat_id, "assistant", final_data['final_output'], reasoning=f"Final output after {final_data.get('consensus_method')}")
-            await websocket.send_json({"type": "final", "prompt_id": prompt_id, "final_source": final_data['final_output']})
-
-    except Exception as e:
-        await websocket.send_json({"type": "error", "prompt_id": prompt_id, "message": "An error occurred."})
+                    _ = decision_response.text
+                except ValueError:
+                    try:
+                        function_call = decision_response.candidates[0].content.parts[0].function_call
+                    except Exception:
+                        pass
+
+            if function_call:
+                tool_name = function_call.name
+                if tool_name in AVAILABLE_TOOLS:
+                    tool_args = {key: value for key, value in function_call.args.items()}
+                    tool_function = AVAILABLE_TOOLS[tool_name]
+                    tool_result = await tool_function(**tool_args)
+                    add_message_to_session(chat_id, "assistant", tool_result, reasoning=f"Direct result from {tool_name}")
+                    await scheduler.send_json({"type": "final", "prompt_id": prompt_id, "final_source": tool_result})
+                    tool_executed = True
+                    outcome = "tool"
+
+            if not tool_executed:
+                if tier >= overload.SINGLE_MODEL:
+                    # Under heavy load: one model, no fan-out, no consensus.
+                    gpt_result = await call_gpt(contextual_prompt)
+                    final_data = {"final_output": gpt_result, "consensus_method": "single_model", "source_model": "gpt"}
+                else:
+                    with metrics.stage("model_fanout"):
+                        gpt_task = asyncio.create_task(call_gpt(contextual_prompt))
+                        deepseek_task = asyncio.create_task(call_deepseek(contextual_prompt))
+                        gpt_result, deepseek_result = await asyncio.gather(gpt_task, deepseek_task)
+
+                    model_outputs = {"gpt": gpt_result, "deepseek": deepseek_result}
+                    with metrics.stage("consensus"):
+                        # The judge is skipped from the first degradation tier on.
+                        final_data = await verify_and_merge(outputs=model_outputs, evidence=[deepseek_result], prompt=contextual_prompt,
+                                                            use_judge=tier < overload.SKIP_JUDGE)
+
+                add_message_to_session(chat_id, "assistant", final_data['final_output'], reasoning=f"Final output after {final_data.get('consensus_method')}")
+                await scheduler.send_json({"type": "final", "prompt_id": prompt_id, "final_source": final_data['final_output']})
+                outcome = final_data.get('consensus_method', "consensus")
+
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Prompt {prompt_id} in chat {chat_id} failed: {e!r}", flush=True)
+            trace.set(error=repr(e))
+            await scheduler.send_json({"type": "error", "prompt_id": prompt_id, "message": "An error occurred."})
+        finally:
+            trace.set(outcome=outcome)
+            metrics.prompts.inc(outcome=outcome)
+            metrics.prompt_seconds.observe(time.perf_counter() - started, outcome=outcome)
 
 
 # --- FastAPI Endpoints ---
 
 @app.get("/")
-async def get():
-    return FileResponse('index.html')
+async def get(request: Request):
+    # Served from memory (precompressed) and revalidated by ETag on each visit.
+    return await serve_file('index.html', request.headers, REVALIDATE_CACHE_CONTROL)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 503 until startup (and warmup, when enabled) has finished, and while refusing prompts under overload."""
+    status_code = 200 if warmup.is_ready() and overload.tier() < overload.REFUSE else 503
+    return JSONResponse(status_code=status_code, content={"ready": status_code == 200, **warmup.state,
+                                                          "overload_tier": overload.tier_name()})
+
+@app.get("/storage/usage")
+async def get_storage_usage():
+    """Reports disk usage, quotas and evictions for the managed artifact directories."""
+    return storage.usage()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: stage and tool latency, token usage, and module counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/projects/{project_id}/events")
+async def get_project_events(project_id: str, since: int = 0):
+    """Returns a project's progress events newer than the `since` sequence number."""
+    task = get_task(project_id)
+    if not task:
+        return JSONResponse(status_code=404, content={"message": f"Project '{project_id}' not found."})
+    changes = events.events_since(project_topic(project_id), since)
+    return {"project_id": project_id, "status": task["status"], **changes}
+
+def _has_files(directory: str) -> bool:
+    return any(files for _, _, files in os.walk(directory))
+
+@app.get("/projects/{project_id}/download")
+async def download_project(project_id: str):
+    """
+    Streams a finalized project as a ZIP archive generated on the fly.
+    The project sources stay on disk for repeated downloads until the storage manager evicts them.
+    """
+    task = get_task(project_id)
+    if not task or task["status"] != "completed":
+        return JSONResponse(status_code=404, content={"message": f"Project '{project_id}' is not finalized."})
+    project_folder = task["project_folder"]
+    if not await asyncio.to_thread(_has_files, project_folder):
+        return JSONResponse(status_code=410, content={"message": f"Project '{project_id}' has expired."})
+    storage.touch_tree(project_folder)
+
+    zip_filename = f"{sanitize_filename(task['prompt'][:30])}.zip"
+    return StreamingResponse(
+        stream_zip(project_folder),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'},
+    )
+
+async def forward_progress(scheduler: PromptScheduler, queue: asyncio.Queue):
+    """Sends queued bus events to the client as `progress` frames, in publish order."""
+    while True:
+        event = await queue.get()
+        await scheduler.send_json({
+            "type": "progress",
+            "topic": event["topic"],
+            "seq": event["seq"],
+            "event": event["event"],
+            "data": event["data"],
+        })
+
+def open_session(client_id: str, chat_id: Optional[str] = None) -> PromptScheduler:
+    """Starts a chat session: its scheduler, progress forwarding, and cleanup for when it expires."""
+    # A chat whose session expired keeps its history for the client that owns it; anyone else
+    # presenting its id gets a fresh chat.
+    history = get_chat_session(chat_id) if chat_id else None
+    if history is None or history.get("client_id") != client_id or chat_id in prompt_scheduler.sessions:
+        chat_id = str(uuid.uuid4())
+    create_chat_session(chat_id, client_id)
+    scheduler = prompt_scheduler.open_session(chat_id, client_id)
+
+    # Bus events for work started in this session are pushed back as progress frames.
+    progress_queue = asyncio.Queue()
+    scheduler.progress_listener = progress_queue.put_nowait
+    progress_task = asyncio.create_task(forward_progress(scheduler, progress_queue))
+
+    def cleanup():
+        events.unsubscribe_all(scheduler.progress_listener)
+        progress_task.cancel()
+        cancelled_jobs = ffmpeg_jobs.cancel_owner(scheduler.progress_listener)
+        if cancelled_jobs:
+            print(f"Cancelled {cancelled_jobs} ffmpeg job(s) for chat {chat_id}.", flush=True)
+    scheduler.on_close.append(cleanup)
+    return scheduler
 
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
+async def websocket_endpoint(websocket: WebSocket, client_id: str, chat_id: Optional[str] = None,
+                             last_frame_seq: Optional[int] = None):
+    """
+    Chat connection. A client that reconnects with `?chat_id=...&last_frame_seq=N` resumes its
+    session: missed frames are replayed and still-running prompts keep reporting to it.
+    """
     await websocket.accept()
-    chat_id = str(uuid.uuid4())
-    create_chat_session(chat_id)
-    
+    scheduler = prompt_scheduler.get_session(chat_id, client_id) if chat_id else None
+    if scheduler is None:
+        scheduler = open_session(client_id, chat_id)
+        last_frame_seq = None
+    chat_id = scheduler.chat_id
+
+    events.current_listener.set(scheduler.progress_listener)
+    storage.current_owner.set(chat_id)
+    # Prompts run as tracked tasks; their frames share one serialized, buffered sender.
+    await scheduler.attach(websocket, last_frame_seq)
+
     try:
         while True:
             data = await websocket.receive_json()
             if data.get("action") == "message":
                 prompt, prompt_id = data.get("prompt"), data.get("prompt_id")
-                file_path = data.get("file_path") 
-                if prompt and prompt_id:
-                    asyncio.create_task(process_single_prompt(websocket, chat_id, prompt, prompt_id, file_path))
+                file_path, file_id = data.get("file_path"), data.get("file_id")
+                if prompt_id and scheduler.seen_prompt(prompt_id):
+                    # Re-sent after a reconnect; its frames were replayed, so it is not run (or paid for) twice.
+                    prompt_scheduler.stats["duplicate_prompts"] += 1
+                    if scheduler.answer_lost(prompt_id):
+                        # Its outcome left the buffer (e.g. a resume with `gap: true`); say so instead of staying silent.
+                        await scheduler.send_json({
+                            "type": "error", "prompt_id": prompt_id,
+                            "message": "The answer to this prompt is no longer available. Please send it again.",
+                        })
+                elif prompt and prompt_id and overload.tier() >= overload.REFUSE:
+                    metrics.prompts.inc(outcome="overloaded")
+                    await scheduler.send_json({
+                        "type": "error", "prompt_id": prompt_id, "retry_after": overload.retry_after(),
+                        "message": f"The server is busy. Please try again in {overload.retry_after()} seconds.",
+                    })
+                elif prompt and prompt_id:
+                    coro = process_single_prompt(scheduler, chat_id, prompt, prompt_id, file_path, file_id)
+                    if not scheduler.submit(prompt_id, coro):
+                        await scheduler.send_json({
+                            "type": "error", "prompt_id": prompt_id,
+                            "message": f"Too many prompts in progress (limit {MAX_INFLIGHT_PROMPTS}). Please wait for one to finish.",
+                        })
+            elif data.get("action") == "cancel":
+                prompt_id = data.get("prompt_id")
+                if prompt_id and scheduler.cancel(prompt_id):
+                    await scheduler.send_json({"type": "cancelled", "prompt_id": prompt_id})
     except WebSocketDisconnect:
         print(f"Client {client_id} disconnected.")
     except Exception as e:
         print(f"Websocket error for client {client_id}: {e}", flush=True)
-
+    finally:
+        # Prompts keep running for SESSION_GRACE_SECONDS in case the client reconnects.
+        scheduler.detach(websocket)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,188 @@
+import os
+import re
+import gzip
+import stat
+import asyncio
+import hashlib
+import mimetypes
+from collections import OrderedDict
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache-friendly static file serving.
+# Small files are read once, kept in memory with precomputed gzip/brotli bodies and a
+# strong content-hash ETag. Files whose names carry a UUID or content hash never change,
+# so they are served as immutable for a year. Larger files (generated video/audio) go
+# through FileResponse, which answers Range requests straight from disk; in-memory files
+# answer single-range requests themselves.
+
+STATIC_MEMORY_MAX_FILE = int(os.getenv("STATIC_MEMORY_MAX_FILE", str(256 * 1024)))
+STATIC_MEMORY_CACHE_BYTES = int(os.getenv("STATIC_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# UUIDs (generated artifacts) and long hex digests (content-addressed uploads) in file names.
+_HASHED_NAME = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{32,}")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+stats = {"memory_hits": 0, "memory_misses": 0, "not_modified": 0, "disk_responses": 0, "cached_bytes": 0}
+
+_cache: OrderedDict = OrderedDict()  # path -> entry
+
+
+class _LargeFileResponse(FileResponse):
+    chunk_size = 1024 * 1024
+
+
+def cache_control_for(path: str) -> str:
+    """Immutable caching for content-hashed/UUID names, revalidation for everything else."""
+    return IMMUTABLE_CACHE_CONTROL if _HASHED_NAME.search(os.path.basename(path)) else REVALIDATE_CACHE_CONTROL
+
+def _load_entry(path: str, st: os.stat_result) -> dict:
+    """Reads a small file and precomputes its compressed bodies. Runs in a worker thread."""
+    with open(path, 'rb') as f:
+        body = f.read()
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    entry = {"key": (st.st_mtime_ns, st.st_size), "media_type": media_type, "etag": etag, "bodies": {"identity": body}}
+
+    if media_type.startswith(_COMPRESSIBLE_TYPES) and len(body) > 512:
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            entry["bodies"]["gzip"] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                entry["bodies"]["br"] = compressed
+    entry["size"] = sum(len(b) for b in entry["bodies"].values())
+    return entry
+
+async def _get_entry(path: str, st: os.stat_result) -> dict:
+    entry = _cache.get(path)
+    if entry and entry["key"] == (st.st_mtime_ns, st.st_size):
+        stats["memory_hits"] += 1
+        _cache.move_to_end(path)
+        return entry
+
+    stats["memory_misses"] += 1
+    entry = await asyncio.to_thread(_load_entry, path, st)
+    old = _cache.pop(path, None)
+    if old:
+        stats["cached_bytes"] -= old["size"]
+    _cache[path] = entry
+    stats["cached_bytes"] += entry["size"]
+    while stats["cached_bytes"] > STATIC_MEMORY_CACHE_BYTES and len(_cache) > 1:
+        _, evicted = _cache.popitem(last=False)
+        stats["cached_bytes"] -= evicted["size"]
+    return entry
+
+def _choose_encoding(entry: dict, accept_encoding: str) -> str:
+    accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in entry["bodies"]:
+            return encoding
+    return "identity"
+
+def _byte_range(range_header: str, size: int):
+    """
+    Parses a single-range `Range` header. Returns (start, end) inclusive, None to send the
+    whole body (absent, malformed or multi-range), or "unsatisfiable".
+    """
+    match = _RANGE.match(range_header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return "unsatisfiable"
+    return start, end
+
+def _range_response(entry: dict, request_headers: Headers, headers: dict) -> Response | None:
+    """206/416 for a Range request on the identity body, or None to answer with the full body."""
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if not range_header or (if_range and if_range.strip() != headers["ETag"]):
+        return None
+    body = entry["bodies"]["identity"]
+    byte_range = _byte_range(range_header, len(body))
+    if byte_range is None:
+        return None
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(body)}"})
+    start, end = byte_range
+    return Response(body[start:end + 1], status_code=206, media_type=entry["media_type"],
+                    headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(body)}"})
+
+def _entry_response(entry: dict, request_headers: Headers, cache_control: str) -> Response:
+    # Ranges refer to the unencoded bytes, so range requests are answered without compression.
+    encoding = "identity" if request_headers.get("range") else _choose_encoding(entry, request_headers.get("accept-encoding", ""))
+    # Each encoding is a different representation, so each gets its own strong ETag.
+    etag = f'"{entry["etag"]}"' if encoding == "identity" else f'"{entry["etag"]}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding", "Accept-Ranges": "bytes"}
+
+    if_none_match = request_headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    if encoding == "identity":
+        partial = _range_response(entry, request_headers, headers)
+        if partial is not None:
+            return partial
+    else:
+        headers["Content-Encoding"] = encoding
+    return Response(entry["bodies"][encoding], media_type=entry["media_type"], headers=headers)
+
+
+async def serve_file(path: str, request_headers: Headers, cache_control: str = None) -> Response:
+    """
+    Serves a single file (e.g. index.html): from memory when small, from disk with Range
+    support otherwise. `cache_control` defaults to `cache_control_for(path)`.
+    """
+    cache_control = cache_control or cache_control_for(path)
+    st = await asyncio.to_thread(os.stat, path)
+    if st.st_size <= STATIC_MEMORY_MAX_FILE:
+        return _entry_response(await _get_entry(path, st), request_headers, cache_control)
+    stats["disk_responses"] += 1
+    response = _LargeFileResponse(path, stat_result=st)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with in-memory precompressed small files and long-lived caching for hashed names."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            full_path, st = await asyncio.to_thread(self.lookup_path, path)
+            if st and stat.S_ISREG(st.st_mode):
+                if st.st_size <= STATIC_MEMORY_MAX_FILE:
+                    entry = await _get_entry(full_path, st)
+                    return _entry_response(entry, Headers(scope=scope), cache_control_for(full_path))
+                stats["disk_responses"] += 1
+                response = _LargeFileResponse(full_path, stat_result=st)
+                response.headers["Cache-Control"] = cache_control_for(full_path)
+                request_headers = Headers(scope=scope)
+                if self.is_not_modified(response.headers, request_headers):
+                    stats["not_modified"] += 1
+                    return Response(status_code=304, headers={
+                        "ETag": response.headers["etag"], "Cache-Control": response.headers["cache-control"],
+                    })
+                return response
+        return await super().get_response(path, scope)
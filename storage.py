@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Lifecycle management for the artifact directories served to clients and local caches.
+# Every file written to a managed directory is tracked in a small index (size, creation,
+# last access, owner). A background task reconciles the index with the disk, deletes
+# files past their TTL and evicts least-recently-used files while a directory is over quota.
+# New files are sharded into two-character subdirectories so no directory grows unbounded.
+# Files registered with the same group (e.g. an image, its variants and their manifest) are
+# aged and evicted as one unit, so a group is never left half-deleted.
+
+STORAGE_INDEX_PATH = os.path.join(".storage", "index.json")
+STORAGE_SCAN_INTERVAL = float(os.getenv("STORAGE_SCAN_INTERVAL", "60"))
+# Files younger than this are never evicted, so in-flight outputs are not deleted under a prompt.
+STORAGE_MIN_AGE = float(os.getenv("STORAGE_MIN_AGE", "600"))
+
+GiB = 1024 * 1024 * 1024
+
+# Per-directory byte quota and time-to-live (seconds since last access, 0 disables TTL).
+MANAGED_DIRS = {
+    "static": {
+        "quota_bytes": int(os.getenv("STATIC_QUOTA_BYTES", str(5 * GiB))),
+        "ttl_seconds": float(os.getenv("STATIC_TTL_SECONDS", str(7 * 24 * 3600))),
+    },
+    "generated_files": {
+        "quota_bytes": int(os.getenv("GENERATED_FILES_QUOTA_BYTES", str(2 * GiB))),
+        "ttl_seconds": float(os.getenv("GENERATED_FILES_TTL_SECONDS", str(7 * 24 * 3600))),
+    },
+    "uploads": {
+        "quota_bytes": int(os.getenv("UPLOADS_QUOTA_BYTES", str(10 * GiB))),
+        "ttl_seconds": float(os.getenv("UPLOADS_TTL_SECONDS", str(30 * 24 * 3600))),
+    },
+    "transcode_cache": {
+        "quota_bytes": int(os.getenv("TRANSCODE_CACHE_QUOTA_BYTES", str(2 * GiB))),
+        "ttl_seconds": float(os.getenv("TRANSCODE_CACHE_TTL_SECONDS", str(2 * 24 * 3600))),
+    },
+    # Each finalized project folder is the source of its streamed download; a folder is one
+    # eviction unit so an archive is never built from a partly evicted project.
+    "projects": {
+        "quota_bytes": int(os.getenv("PROJECTS_QUOTA_BYTES", str(2 * GiB))),
+        "ttl_seconds": float(os.getenv("PROJECTS_TTL_SECONDS", str(7 * 24 * 3600))),
+        "group_subdirs": True,
+    },
+}
+
+for _directory in MANAGED_DIRS:
+    os.makedirs(_directory, exist_ok=True)
+os.makedirs(os.path.dirname(STORAGE_INDEX_PATH), exist_ok=True)
+
+# Owner (e.g. chat id) of artifacts created while serving the current prompt. Set by the server.
+current_owner: ContextVar[Optional[str]] = ContextVar("current_owner", default=None)
+
+# Called with the path of every evicted file, e.g. so the upload store can drop its record.
+eviction_hooks: list = []
+
+stats = {"evictions": {d: 0 for d in MANAGED_DIRS}, "evicted_bytes": {d: 0 for d in MANAGED_DIRS}, "last_scan_seconds": 0.0}
+
+_index: Dict[str, dict] = {}
+_dirty = False
+
+
+def _load_index():
+    global _index
+    try:
+        with open(STORAGE_INDEX_PATH, 'r', encoding='utf-8') as f:
+            _index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        _index = {}
+
+def _save_index(snapshot: dict):
+    tmp_path = f"{STORAGE_INDEX_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, STORAGE_INDEX_PATH)
+
+_load_index()
+
+
+def _managed_dir(path: str) -> Optional[str]:
+    top = os.path.normpath(path).split(os.sep)[0]
+    return top if top in MANAGED_DIRS else None
+
+def _is_internal(name: str) -> bool:
+    # Bookkeeping files (e.g. uploads/index.json, uploads/.incoming/) are never managed.
+    return name.startswith(".") or name == "index.json"
+
+
+def shard_path(directory: str, filename: str) -> str:
+    """
+    Returns the sharded location for a new file, e.g. static/3f/<filename>, creating the shard.
+    The path stays under the directory's mount, so the URL is just "/" + path.
+    """
+    shard = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2]
+    shard_dir = os.path.join(directory, shard)
+    os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, filename)
+
+def register(path: str, owner: str = None, group: str = None):
+    """Starts tracking a file written to a managed directory, optionally as a member of `group`."""
+    global _dirty
+    path = os.path.normpath(path.lstrip("/"))
+    if not _managed_dir(path):
+        return
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    now = time.time()
+    _index[path] = {
+        "size": size,
+        "created": now,
+        "last_access": now,
+        "owner": owner or current_owner.get(),
+        "group": group,
+    }
+    _dirty = True
+
+def register_group(paths: list, owner: str = None):
+    """Tracks files that must be evicted together; the group is named after the first path."""
+    group = os.path.normpath(paths[0].lstrip("/"))
+    for path in paths:
+        register(path, owner, group)
+
+def touch(path: str):
+    """Records an access to a tracked file (cheap; called on every static request)."""
+    global _dirty
+    record = _index.get(os.path.normpath(path.lstrip("/")))
+    if record:
+        record["last_access"] = time.time()
+        _dirty = True
+
+def touch_tree(directory: str):
+    """Records an access to every tracked file under `directory`."""
+    global _dirty
+    prefix = os.path.normpath(directory.lstrip("/")) + os.sep
+    now = time.time()
+    for path, record in _index.items():
+        if path.startswith(prefix):
+            record["last_access"] = now
+            _dirty = True
+
+
+def usage() -> dict:
+    """Returns bytes, file counts, quotas and eviction totals per managed directory."""
+    report = {d: {"bytes": 0, "files": 0, **config} for d, config in MANAGED_DIRS.items()}
+    for path, record in _index.items():
+        directory = _managed_dir(path)
+        if directory:
+            report[directory]["bytes"] += record["size"]
+            report[directory]["files"] += 1
+    for directory in report:
+        report[directory]["evictions"] = stats["evictions"][directory]
+        report[directory]["evicted_bytes"] = stats["evicted_bytes"][directory]
+    return report
+
+
+def _scan_disk() -> Dict[str, tuple]:
+    """Walks the managed directories and returns {path: (size, mtime)}. Runs in a worker thread."""
+    found = {}
+    for directory in MANAGED_DIRS:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not _is_internal(d)]
+            for name in files:
+                if _is_internal(name):
+                    continue
+                path = os.path.normpath(os.path.join(root, name))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_size, st.st_mtime)
+    return found
+
+def _unit_key(path: str, record: dict, config: dict) -> str:
+    if record.get("group"):
+        return record["group"]
+    parts = path.split(os.sep)
+    if config.get("group_subdirs") and len(parts) > 2:
+        return os.path.join(parts[0], parts[1])
+    return path
+
+def _eviction_units(directory: str, config: dict) -> list:
+    """
+    Returns the directory's files as eviction units, least recently used first. Ungrouped files
+    are units of one; a group is as new and as recently used as its newest member.
+    """
+    units: Dict[str, dict] = {}
+    for path, record in _index.items():
+        if _managed_dir(path) != directory:
+            continue
+        unit = units.setdefault(_unit_key(path, record, config), {"paths": [], "size": 0, "created": 0.0, "last_access": 0.0})
+        unit["paths"].append(path)
+        unit["size"] += record["size"]
+        unit["created"] = max(unit["created"], record["created"])
+        unit["last_access"] = max(unit["last_access"], record["last_access"])
+    return sorted(units.values(), key=lambda unit: unit["last_access"])
+
+def _plan_evictions(now: float) -> list:
+    """Picks the files to delete: expired ones first, then LRU until each directory fits its quota."""
+    victims = []
+    for directory, config in MANAGED_DIRS.items():
+        units = _eviction_units(directory, config)
+        total = sum(unit["size"] for unit in units)
+        for unit in units:
+            if now - unit["created"] < STORAGE_MIN_AGE:
+                continue
+            expired = config["ttl_seconds"] and now - unit["last_access"] > config["ttl_seconds"]
+            if expired or total > config["quota_bytes"]:
+                victims.extend((directory, path, _index[path]["size"]) for path in unit["paths"])
+                total -= unit["size"]
+    return victims
+
+def _delete_files(paths: list):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+async def run_maintenance():
+    """One maintenance pass: reconcile the index with the disk, evict, and persist the index."""
+    global _dirty
+    started = time.perf_counter()
+    scan_started_at = time.time()
+    on_disk = await asyncio.to_thread(_scan_disk)
+
+    # Files that vanished are forgotten; files written without `register` are adopted.
+    # Records registered while the scan was running are left alone.
+    for path in [p for p, r in _index.items() if p not in on_disk and r["created"] < scan_started_at]:
+        del _index[path]
+        _dirty = True
+    for path, (size, mtime) in on_disk.items():
+        record = _index.get(path)
+        if record is None:
+            _index[path] = {"size": size, "created": mtime, "last_access": mtime, "owner": None, "group": None}
+            _dirty = True
+        elif record["size"] != size:
+            record["size"] = size
+            _dirty = True
+
+    victims = _plan_evictions(time.time())
+    if victims:
+        await asyncio.to_thread(_delete_files, [path for _, path, _ in victims])
+        for directory, path, size in victims:
+            _index.pop(path, None)
+            stats["evictions"][directory] += 1
+            stats["evicted_bytes"][directory] += size
+            for hook in eviction_hooks:
+                try:
+                    hook(path)
+                except Exception as e:
+                    print(f"Storage eviction hook failed for {path}: {e}", flush=True)
+        print(f"Storage manager evicted {len(victims)} file(s).", flush=True)
+        _dirty = True
+
+    if _dirty:
+        _dirty = False
+        await asyncio.to_thread(_save_index, {path: dict(record) for path, record in _index.items()})
+    stats["last_scan_seconds"] = time.perf_counter() - started
+
+async def run_storage_manager(interval: float = None):
+    """Background loop that runs `run_maintenance` every `interval` seconds."""
+    interval = STORAGE_SCAN_INTERVAL if interval is None else interval
+    while True:
+        try:
+            await run_maintenance()
+        except Exception as e:
+            print(f"Storage manager error: {e}", flush=True)
+        await asyncio.sleep(interval)
@@ -2,6 +2,9 @@ import uuid
 import os
 from datetime import datetime
 
+import events
+import storage
+
 # In-memory storage for tasks. In a production system, this would be a database.
 _tasks = {}
 
@@ -12,6 +15,10 @@ def get_project_folder(project_id: str) -> str:
     """Returns the root folder for a given project."""
     return os.path.join(PROJECTS_DIR, project_id)
 
+def project_topic(project_id: str) -> str:
+    """Returns the event bus topic that carries a project's progress events."""
+    return f"project:{project_id}"
+
 def create_project_task(prompt: str) -> dict:
     """
     Initializes a new project-building task.
@@ -28,9 +35,11 @@ def create_project_task(prompt: str) -> dict:
         "created_at": datetime.utcnow().isoformat(),
         "completed_at": None,
         "subtasks": [],
-        "project_folder": project_folder
+        "project_folder": project_folder,
+        "artifact_stats": {"model_calls": 0, "model_calls_saved": 0, "bytes_saved": 0}
     }
     _tasks[project_id] = task
+    events.publish(project_topic(project_id), "project_created", {"status": task["status"]})
     return task
 
 def get_task(project_id: str) -> dict:
@@ -58,6 +67,13 @@ def add_subtasks(project_id: str, subtasks_plan: list):
         }
         task["subtasks"].append(new_subtask)
 
+    events.publish(project_topic(project_id), "subtasks_added", {
+        "subtasks": [
+            {"subtask_id": s["subtask_id"], "action": s.get("action"), "path": s.get("path"), "status": s["status"]}
+            for s in task["subtasks"]
+        ]
+    })
+
 
 def get_next_pending_subtask(project_id: str) -> dict | None:
     """Finds and returns the next sub-task with 'pending' status."""
@@ -80,12 +96,28 @@ def update_subtask_status(project_id: str, subtask_id: str, status: str, result:
         if subtask["subtask_id"] == subtask_id:
             subtask["status"] = status
             subtask["result"] = result
+            events.publish(project_topic(project_id), "subtask_status", {
+                "subtask_id": subtask_id,
+                "action": subtask.get("action"),
+                "path": subtask.get("path"),
+                "status": status,
+                "result": result,
+            })
             break
 
+def forget_evicted_project(path: str):
+    """Storage eviction hook: once a project's folder is evicted, its progress topic is dropped."""
+    parts = os.path.normpath(path).split(os.sep)
+    if len(parts) > 2 and parts[0] == PROJECTS_DIR:
+        events.forget(project_topic(parts[1]))
+
+storage.eviction_hooks.append(forget_evicted_project)
+
 def complete_project_task(project_id: str):
     """Marks the main project task as completed."""
     task = get_task(project_id)
     if task:
         task["status"] = "completed"
         task["completed_at"] = datetime.utcnow().isoformat()
+        events.publish(project_topic(project_id), "project_completed", {"completed_at": task["completed_at"]})
 
@@ -0,0 +1,52 @@
+import asyncio
+
+import media_analysis
+
+
+def test_coalesce_survives_owner_cancellation():
+    async def scenario():
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "analysis"
+
+        owner = asyncio.create_task(media_analysis._coalesce("key", factory))
+        await asyncio.sleep(0)
+        other = asyncio.create_task(media_analysis._coalesce("key", factory))
+        await asyncio.sleep(0)
+        owner.cancel()
+        result = await other
+        assert owner.cancelled()
+        return result, calls
+
+    result, calls = asyncio.run(scenario())
+    assert result == "analysis"
+    assert calls == [1]
+    assert not media_analysis._inflight
+
+
+def test_coalesce_cancels_work_when_every_caller_is_gone():
+    async def scenario():
+        started = asyncio.Event()
+        cancelled = []
+
+        async def factory():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        callers = [asyncio.create_task(media_analysis._coalesce("key", factory)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return cancelled
+
+    assert asyncio.run(scenario()) == [1]
+    assert not media_analysis._inflight
@@ -0,0 +1,39 @@
+import os
+import json
+import asyncio
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import events
+import tasks
+import tools
+
+
+class _StubCompletions:
+    def __init__(self, plan: dict):
+        self.plan = plan
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        message = SimpleNamespace(content=json.dumps(self.plan))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_build_project_creates_task_from_plan(monkeypatch, tmp_path):
+    plan = {"subtasks": [{"action": "WRITE_FILE", "path": "/app/main.py", "content_prompt": "Hello world"}]}
+    completions = _StubCompletions(plan)
+    monkeypatch.setattr(tools, "openai_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(tasks, "PROJECTS_DIR", str(tmp_path))
+
+    result = asyncio.run(tools.build_project("a todo app"))
+
+    assert result.startswith("Project build started with ID: "), result
+    project_id = result.split("ID: ")[1].split(".")[0]
+    task = tasks.get_task(project_id)
+    assert [s["action"] for s in task["subtasks"]] == ["WRITE_FILE"]
+    assert completions.calls[0]["messages"][0]["role"] == "user"
+    assert completions.calls[0]["response_format"] == {"type": "json_object"}
+    history = events.events_since(tasks.project_topic(project_id))["events"]
+    assert [e["event"] for e in history] == ["project_created", "subtasks_added"]
@@ -1,15 +1,20 @@
 
 import os
 import re
+import asyncio
 import httpx
 import json
 import uuid
-from bs4 import BeautifulSoup
-from tavily import TavilyClient
 import openai
-import zipfile # For zipping directories
 import shutil # For removing directories
-from pypdf import PdfReader
+
+import events
+import artifacts
+from zipstream import write_zip
+import upload_store
+import storage
+import downloader
+import image_variants
 
 # New import for our task management system
 from tasks import (
@@ -19,7 +24,8 @@ from tasks import (
     update_subtask_status,
     complete_project_task,
     get_project_folder,
-    get_task
+    get_task,
+    project_topic
 )
 
 # --- Directory Setup ---
@@ -44,13 +50,21 @@ def sanitize_filename(filename: str) -> str:
 
 # --- API Client Configurations ---
 
-try:
-    tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
-except KeyError:
+# Tavily, BeautifulSoup and pypdf are imported on first use to keep startup fast.
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+if not TAVILY_API_KEY:
     print("Warning: TAVILY_API_KEY not found. Web search will be disabled.", flush=True)
-    tavily_client = None
+_tavily_client = None
+
+def get_tavily_client():
+    """Returns the Tavily client, creating it on first call (None without an API key). Blocking."""
+    global _tavily_client
+    if _tavily_client is None and TAVILY_API_KEY:
+        from tavily import TavilyClient
+        _tavily_client = TavilyClient(api_key=TAVILY_API_KEY, api_base_url=os.getenv("TAVILY_BASE_URL"))
+    return _tavily_client
 
-openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
 
 # Replicate API Token
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
@@ -60,10 +74,11 @@ REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 
 async def tavily_web_search(query: str) -> str:
     """Performs a web search and returns results as JSON."""
-    if not tavily_client:
+    if not TAVILY_API_KEY:
         return "Error: Tavily API key not configured."
     try:
-        response = tavily_client.search(query=query, search_depth="advanced")
+        # The Tavily client is synchronous; run it (and its first import) off the event loop.
+        response = await asyncio.to_thread(lambda: get_tavily_client().search(query=query, search_depth="advanced"))
         return json.dumps(response["results"])
     except Exception as e:
         return f"Error during web search: {e}"
@@ -74,6 +89,7 @@ async def scrape_url(url: str) -> str:
         async with httpx.AsyncClient(timeout=10.0) as client:
             response = await client.get(url, follow_redirects=True)
             response.raise_for_status()
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(response.text, 'html.parser')
         for script_or_style in soup(['script', 'style']):
             script_or_style.decompose()
@@ -82,33 +98,46 @@ async def scrape_url(url: str) -> str:
     except Exception as e:
         return f"Error scraping {url}: {e}"
 
+async def _generate_image_file(prompt: str) -> str:
+    """Generates an image with DALL-E, saves it under static/ and returns its file path."""
+    response = await openai_client.images.generate(
+        model="dall-e-3",
+        prompt=prompt,
+        size="1024x1024",
+        n=1,
+    )
+    image_url = response.data[0].url
+    if not image_url:
+        raise RuntimeError("Could not get image URL.")
+
+    filename = f"{uuid.uuid4()}.png"
+    filepath = storage.shard_path("static", filename)
+    await downloader.download(image_url, filepath)
+    storage.register(filepath)
+    return filepath
+
 async def generate_image(prompt: str) -> str:
-    """Generates an image and returns its local path."""
+    """
+    Generates an image and returns its local path.
+    Smaller WebP/AVIF variants and a manifest (same path, .json) are written next to it.
+    """
     if not openai_client.api_key:
         return "Error: OpenAI API key not configured."
     try:
-        response = await openai_client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            n=1,
-        )
-        image_url = response.data[0].url
-        if not image_url:
-            return "Error: Could not get image URL."
-
-        async with httpx.AsyncClient() as client:
-            image_response = await client.get(image_url)
-            image_response.raise_for_status()
-
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join("static", filename)
-        with open(filepath, "wb") as f:
-            f.write(image_response.content)
-        return f"/{filepath}" # Return as a URL path
+        filepath = await _generate_image_file(prompt)
     except Exception as e:
         return f"Error generating image: {e}"
 
+    try:
+        manifest = await asyncio.to_thread(image_variants.build_variants, filepath)
+        if manifest:
+            # The image, its variants and the manifest that points at them are evicted together.
+            storage.register_group([filepath] + image_variants.written_paths(filepath, manifest))
+    except Exception as e:
+        # Variants are an optimization; the original image is still usable.
+        print(f"Could not build image variants for {filepath}: {e}", flush=True)
+    return f"/{filepath}" # Return as a URL path
+
 async def write_file(filename: str, content: str) -> str:
     """
     Writes content to a sanitized file in the 'generated_files' directory and returns the download link.
@@ -118,22 +147,37 @@ async def write_file(filename: str, content: str) -> str:
     if not sanitized_filename:
         return "Error: Filename is invalid or was completely sanitized."
 
-    save_path = os.path.join("generated_files", sanitized_filename)
+    save_path = storage.shard_path("generated_files", sanitized_filename)
     
     try:
         with open(save_path, 'w', encoding='utf-8') as f:
             f.write(content)
+        storage.register(save_path)
         
         # Return the public-facing download URL
-        download_url = f"/downloads/{sanitized_filename}"
+        download_url = f"/downloads/{os.path.relpath(save_path, 'generated_files')}"
         return f"File written successfully. Download it here: {download_url}"
 
     except Exception as e:
         return f"Error writing file: {e}"
 
+# Extracted text of stored uploads, keyed by file id. Uploads are content-addressed,
+# so a file id always refers to the same bytes and its text never goes stale.
+_document_text_cache: dict = {}
+DOCUMENT_TEXT_CACHE_SIZE = 64
+
+def _extract_document_text(full_path: str, extension: str) -> str:
+    if extension == '.pdf':
+        from pypdf import PdfReader
+        with open(full_path, 'rb') as f:
+            reader = PdfReader(f)
+            return "".join(page.extract_text() for page in reader.pages)
+    with open(full_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
 async def read_document(file_path: str) -> str:
-    """Reads the text content of a document (PDF, TXT, etc.) from the uploads directory."""
-    full_path = os.path.join("uploads", os.path.basename(file_path))
+    """Reads the text content of a document (PDF, TXT, etc.) from the uploads directory, by path or file id."""
+    full_path = upload_store.resolve_path(file_path)
 
     if not os.path.exists(full_path):
         return f"Error: File '{os.path.basename(file_path)}' not found in uploads. Please ensure the file is uploaded and the name is correct."
@@ -141,26 +185,45 @@ async def read_document(file_path: str) -> str:
     try:
         _, extension = os.path.splitext(full_path)
         extension = extension.lower()
-
-        if extension == '.pdf':
-            with open(full_path, 'rb') as f:
-                reader = PdfReader(f)
-                text = "".join(page.extract_text() for page in reader.pages)
-            return text
-        elif extension == '.txt':
-            with open(full_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        else:
+        if extension not in ('.pdf', '.txt'):
             return f"Error: Unsupported document type: {extension}"
+
+        file_id = upload_store.file_id_for_path(full_path)
+        if file_id and file_id in _document_text_cache:
+            return _document_text_cache[file_id]
+
+        text = await asyncio.to_thread(_extract_document_text, full_path, extension)
+        if file_id:
+            if len(_document_text_cache) >= DOCUMENT_TEXT_CACHE_SIZE:
+                _document_text_cache.pop(next(iter(_document_text_cache)))
+            _document_text_cache[file_id] = text
+        return text
     except Exception as e:
         return f"Error reading document: {e}"
 
-async def get_task_status(project_id: str) -> str:
-    """Gets the status of a project task, including its subtasks."""
+async def get_task_status(project_id: str, since_seq: int = None) -> str:
+    """
+    Gets the status of a project task, including its subtasks.
+    With `since_seq`, only the progress events newer than that sequence number are returned.
+    """
     task = get_task(project_id)
     if not task:
         return f"Error: Project with ID '{project_id}' not found."
-    return json.dumps(task, indent=2)
+
+    topic = project_topic(project_id)
+    events.subscribe_current(topic)
+
+    if since_seq is None:
+        return json.dumps({**task, "latest_seq": events.latest_seq(topic)}, separators=(",", ":"))
+
+    changes = events.events_since(topic, int(since_seq))
+    return json.dumps({
+        "project_id": project_id,
+        "status": task["status"],
+        "latest_seq": changes["latest_seq"],
+        "truncated": changes["truncated"],
+        "events": [{"seq": e["seq"], "event": e["event"], **e["data"]} for e in changes["events"]],
+    }, separators=(",", ":"))
 
 async def build_project(prompt: str) -> str:
     """
@@ -186,8 +249,8 @@ async def build_project(prompt: str) -> str:
     try:
         response = await openai_client.chat.completions.create(
             model="gpt-4-turbo",
-            messages=[{{"role": "user", "content": decomposer_prompt}}],
-            response_format={{"type": "json_object"}},
+            messages=[{"role": "user", "content": decomposer_prompt}],
+            response_format={"type": "json_object"},
         )
         plan_str = response.choices[0].message.content
         plan = json.loads(plan_str)
@@ -195,10 +258,12 @@ async def build_project(prompt: str) -> str:
 
         project_task = create_project_task(prompt)
         project_id = project_task["project_id"]
+        # Stream this build's progress to the connection that started it.
+        events.subscribe_current(project_topic(project_id))
 
         add_subtasks(project_id, subtasks_plan)
 
-        return f"Project build started with ID: {project_id}. You can check the status at any time."
+        return f"Project build started with ID: {project_id}. Progress updates will be pushed as tasks run."
 
     except Exception as e:
         return f"Error starting project build: {e}"
@@ -225,33 +290,66 @@ async def execute_next_task(project_id: str) -> str:
     action = subtask.get("action")
     result = ""
 
+    events.subscribe_current(project_topic(project_id))
+    update_subtask_status(project_id, subtask_id, "running")
+
     try:
+        build_stats = get_task(project_id)["artifact_stats"]
+
         if action == "WRITE_FILE":
             path = subtask.get("path")
             content_prompt = subtask.get("content_prompt")
-            
-            content_response = await openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[{{"role": "user", "content": content_prompt}}],
-            )
-            file_content = content_response.choices[0].message.content
 
             project_folder = get_project_folder(project_id)
             full_path = os.path.join(project_folder, path.lstrip("/"))
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(file_content)
-            result = f"File written to {path}"
+
+            role = artifacts.path_role(path)
+            key = artifacts.artifact_key("gpt-4", content_prompt, role)
+            blob_path = artifacts.lookup(key) if artifacts.reuse_allowed(role) else None
+
+            if blob_path:
+                nbytes = artifacts.materialize(blob_path, full_path)
+                artifacts.record(build_stats, reused=True, nbytes=nbytes)
+                result = f"File written to {path} (reused a previously generated artifact)"
+            else:
+                content_response = await openai_client.chat.completions.create(
+                    model="gpt-4",
+                    messages=[{"role": "user", "content": content_prompt}],
+                )
+                file_content = content_response.choices[0].message.content
+                artifacts.record(build_stats, reused=False)
+
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w', encoding='utf-8') as f:
+                    f.write(file_content)
+                artifacts.store_file(key, full_path)
+                result = f"File written to {path}"
 
         elif action == "GENERATE_LOGO":
             prompt = subtask.get("prompt")
-            logo_path = await generate_image(prompt)
-            
+
             project_folder = get_project_folder(project_id)
             static_dir = os.path.join(project_folder, "static")
             os.makedirs(static_dir, exist_ok=True)
-            shutil.move(logo_path.lstrip("/"), os.path.join(static_dir, os.path.basename(logo_path)))
-            result = f"Logo generated and saved to /static/{os.path.basename(logo_path)}"
+
+            key = artifacts.artifact_key("dall-e-3", prompt, "logo")
+            blob_path = artifacts.lookup(key) if artifacts.reuse_allowed("logo") else None
+
+            if blob_path:
+                logo_filename = f"{uuid.uuid4()}.png"
+                nbytes = artifacts.materialize(blob_path, os.path.join(static_dir, logo_filename))
+                artifacts.record(build_stats, reused=True, nbytes=nbytes)
+                result = f"Logo reused from a previous build and saved to /static/{logo_filename}"
+            else:
+                # Logos are moved into the project, so no web variants are built for them.
+                logo_path = await _generate_image_file(prompt)
+                artifacts.record(build_stats, reused=False)
+
+                logo_filename = os.path.basename(logo_path)
+                saved_path = os.path.join(static_dir, logo_filename)
+                shutil.move(logo_path, saved_path)
+                artifacts.store_file(key, saved_path)
+                result = f"Logo generated and saved to /static/{logo_filename}"
 
         update_subtask_status(project_id, subtask_id, "completed", result)
         return f"Subtask {subtask_id} completed: {result}"
@@ -261,27 +359,33 @@ async def execute_next_task(project_id: str) -> str:
         return f"Error executing subtask {subtask_id}: {e}"
 
 async def finalize_project(project_id: str) -> str:
-    """Zips the project and provides a download link. This is the final step."""
+    """
+    Completes the project and provides a download link. This is the final step.
+    The archive is not written to disk; it is zipped on the fly when the link is downloaded.
+    """
     project_task = get_task(project_id)
     if not project_task:
         return f"Error: Project with ID '{project_id}' not found."
 
     if project_task["status"] == "completed":
-        return "Project is already complete."
+        return f"Project is already complete. Download it here: /projects/{project_id}/download"
 
     # Verify all subtasks are complete
-    if any(s["status"] == "pending" for s in project_task["subtasks"]):
+    if any(s["status"] in ("pending", "running") for s in project_task["subtasks"]):
         return "Error: Not all tasks are complete. Cannot finalize project."
 
     project_folder = get_project_folder(project_id)
-    project_name = sanitize_filename(project_task['prompt'][:30])
-    zip_filename = f"{project_name}.zip"
-    
+    if not os.path.isdir(project_folder):
+        return f"Error: Project folder for '{project_id}' is missing."
+
     try:
-        zip_result = await zip_directory(project_folder, zip_filename)
         complete_project_task(project_id)
-        shutil.rmtree(project_folder) # Clean up project files
-        return f"Project finalized successfully! {zip_result}"
+        build_stats = project_task["artifact_stats"]
+        return (
+            f"Project finalized successfully! Download it here: /projects/{project_id}/download "
+            f"(model calls: {build_stats['model_calls']}, reused artifacts: {build_stats['model_calls_saved']}, "
+            f"bytes saved: {build_stats['bytes_saved']})"
+        )
     except Exception as e:
         return f"Error finalizing project: {e}"
 
@@ -292,17 +396,13 @@ async def zip_directory(directory_path: str, output_zip_filename: str) -> str:
     if not sanitized_zip_filename:
         return "Error: Output zip filename is invalid."
     
-    output_zip_path = os.path.join("generated_files", sanitized_zip_filename)
+    output_zip_path = storage.shard_path("generated_files", sanitized_zip_filename)
 
     try:
-        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(directory_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, start=directory_path)
-                    zipf.write(file_path, arcname)
-        
-        download_url = f"/downloads/{sanitized_zip_filename}"
+        await asyncio.to_thread(write_zip, directory_path, output_zip_path)
+        storage.register(output_zip_path)
+
+        download_url = f"/downloads/{os.path.relpath(output_zip_path, 'generated_files')}"
         return f"Directory zipped successfully. Download it here: {download_url}"
 
     except Exception as e:
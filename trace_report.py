@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import argparse
+
+# Reads trace files written by tracing.py and prints either a text waterfall for one
+# prompt or a summary of the slowest spans across every trace.
+#
+#   python trace_report.py                      # summary of traces/traces.jsonl (+ rotated files)
+#   python trace_report.py --prompt <prompt_id> # waterfall for one prompt
+#   python trace_report.py --last               # waterfall for the most recent trace
+
+BAR_WIDTH = 50
+
+
+def default_files() -> list:
+    trace_file = os.getenv("TRACE_FILE", os.path.join("traces", "traces.jsonl"))
+    rotated = [f"{trace_file}.{i}" for i in range(1, 100) if os.path.exists(f"{trace_file}.{i}")]
+    # Oldest rotated file first so traces come out in write order.
+    return list(reversed(rotated)) + [trace_file]
+
+def load_traces(paths: list) -> list:
+    traces = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        traces.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # A line cut short by a crash or rotation.
+    return traces
+
+
+def _format_attrs(attrs: dict) -> str:
+    return " ".join(f"{key}={value}" for key, value in attrs.items() if value is not None)
+
+def render_waterfall(trace: dict) -> str:
+    """Renders one trace as an indented span tree with bars on a shared timeline."""
+    total = trace["duration_ms"] or 1.0
+    children = {}
+    for span in trace["spans"]:
+        children.setdefault(span["parent_id"], []).append(span)
+    for spans in children.values():
+        spans.sort(key=lambda s: s["start_ms"])
+
+    lines = [f"prompt {trace['prompt_id']}  trace {trace['trace_id']}  {trace['duration_ms']:.1f} ms"]
+
+    def walk(parent_id, depth):
+        for span in children.get(parent_id, []):
+            offset = int(span["start_ms"] / total * BAR_WIDTH)
+            length = max(1, int(span["duration_ms"] / total * BAR_WIDTH))
+            bar = (" " * offset + "#" * length).ljust(BAR_WIDTH)[:BAR_WIDTH]
+            error = f" !{span['error']}" if span.get("error") else ""
+            lines.append(
+                f"{span['start_ms']:>9.1f} {span['duration_ms']:>9.1f} ms |{bar}| "
+                f"{'  ' * depth}{span['name']}{error} {_format_attrs(span.get('attrs', {}))}".rstrip()
+            )
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def render_summary(traces: list, top: int) -> str:
+    """Per-span-name latency percentiles plus the slowest individual spans."""
+    by_name = {}
+    all_spans = []
+    for trace in traces:
+        for span in trace["spans"]:
+            by_name.setdefault(span["name"], []).append(span["duration_ms"])
+            all_spans.append((span["duration_ms"], span["name"], trace["prompt_id"]))
+
+    lines = [f"{len(traces)} traces, {len(all_spans)} spans", "",
+             f"{'span':<32} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total s':>9}"]
+    for name, durations in sorted(by_name.items(), key=lambda item: -sum(item[1])):
+        lines.append(
+            f"{name[:32]:<32} {len(durations):>7} {_percentile(durations, 0.5):>10.1f} "
+            f"{_percentile(durations, 0.95):>10.1f} {max(durations):>10.1f} {sum(durations) / 1000:>9.1f}"
+        )
+
+    lines += ["", f"Top {top} slowest spans:"]
+    for duration, name, prompt_id in sorted(all_spans, reverse=True)[:top]:
+        lines.append(f"{duration:>10.1f} ms  {name:<32} prompt {prompt_id}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render prompt traces written by tracing.py.")
+    parser.add_argument("files", nargs="*", help="Trace JSONL files (default: TRACE_FILE and its rotations).")
+    parser.add_argument("--prompt", help="Show the waterfall for this prompt id.")
+    parser.add_argument("--last", action="store_true", help="Show the waterfall for the most recent trace.")
+    parser.add_argument("--top", type=int, default=20, help="Number of slow spans to list (default 20).")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.files or default_files())
+    if not traces:
+        print("No traces found.")
+        return 1
+
+    if args.prompt:
+        matching = [t for t in traces if t["prompt_id"] == args.prompt]
+        if not matching:
+            print(f"No trace for prompt '{args.prompt}'.")
+            return 1
+        print("\n\n".join(render_waterfall(t) for t in matching))
+    elif args.last:
+        print(render_waterfall(traces[-1]))
+    else:
+        print(render_summary(traces, args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
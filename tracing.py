@@ -0,0 +1,154 @@
+import os
+import time
+import json
+import uuid
+import queue
+import random
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-prompt span trees.
+# A trace is started for each prompt; `span()` blocks opened anywhere below it (provider
+# calls, consensus stages, tools, media jobs) attach to the innermost open span through a
+# ContextVar, which asyncio copies into child tasks. Finished traces are sampled and
+# appended as one JSON line each to a rotating file; trace_report.py renders them.
+
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("traces", "traces.jsonl"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# Traces slower than this (and failed ones) are kept even when not sampled (0 disables).
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "10"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(20 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+
+stats = {"traces": 0, "written": 0, "spans": 0}
+
+current_span: ContextVar = ContextVar("current_span", default=None)
+
+_logger = None
+
+
+class Span:
+    """A timed operation inside a trace. Attributes hold sizes, counts and queue waits."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "started", "ended", "attrs", "error")
+
+    def __init__(self, trace, name: str, parent_id: str | None, attrs: dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.ended = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        origin = self.trace.root.started
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round(((self.ended or time.perf_counter()) - self.started) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """Returned when no trace is being recorded, so callers can always call `set()`."""
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    def __init__(self, prompt_id: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.prompt_id = prompt_id
+        self.sampled = sampled
+        self.started_at = time.time()
+        self.spans: list = []
+        self.root = None
+
+
+def _get_logger():
+    """Rotating JSONL writer. Records are handed to a listener thread so the loop never blocks on disk."""
+    global _logger
+    if _logger is None:
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        logging.handlers.QueueListener(records, handler).start()
+        _logger = logging.getLogger("tiwa.traces")
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        _logger.addHandler(logging.handlers.QueueHandler(records))
+    return _logger
+
+def _finish(trace: Trace):
+    duration = trace.root.ended - trace.root.started
+    # Failed and slow prompts are always kept; the rest are sampled.
+    failed = "error" in trace.root.attrs or any(span.error for span in trace.spans)
+    if not (trace.sampled or failed or (TRACE_SLOW_SECONDS and duration >= TRACE_SLOW_SECONDS)):
+        return
+    record = {
+        "trace_id": trace.trace_id,
+        "prompt_id": trace.prompt_id,
+        "started_at": trace.started_at,
+        "duration_ms": round(duration * 1000, 3),
+        "spans": [span.to_dict() for span in trace.spans],
+    }
+    _get_logger().info(json.dumps(record, default=str))
+    stats["written"] += 1
+
+
+@contextmanager
+def start_trace(prompt_id: str, name: str = "prompt", **attrs):
+    """Opens the root span for a prompt. Nothing is recorded when tracing is disabled."""
+    if TRACE_SAMPLE_RATE <= 0 and TRACE_SLOW_SECONDS <= 0:
+        yield NULL_SPAN
+        return
+    trace = Trace(prompt_id, random.random() < TRACE_SAMPLE_RATE)
+    stats["traces"] += 1
+    try:
+        with _open_span(trace, name, None, attrs) as root:
+            trace.root = root
+            yield root
+    finally:
+        _finish(trace)
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times a block as a child of the current span. A no-op outside a trace."""
+    parent = current_span.get()
+    if parent is None:
+        yield NULL_SPAN
+        return
+    with _open_span(parent.trace, name, parent.span_id, attrs) as child:
+        yield child
+
+@contextmanager
+def _open_span(trace: Trace, name: str, parent_id: str | None, attrs: dict):
+    current = Span(trace, name, parent_id, attrs)
+    trace.spans.append(current)
+    stats["spans"] += 1
+    token = current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.ended = time.perf_counter()
+        current_span.reset(token)
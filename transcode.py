@@ -0,0 +1,128 @@
+import os
+import time
+import mimetypes
+
+import storage
+import ffmpeg_jobs
+import tracing
+
+# Local pre-transcoding of media before it is uploaded for analysis.
+# Speech and scene understanding do not need 48 kHz stereo or 4K frames, so audio is
+# reduced to mono 16 kHz Opus and video to a small, low-fps rendition (or keyframes only).
+# Outputs are cached by source hash and profile, and are only used when they are smaller.
+
+TRANSCODE_CACHE_DIR = "transcode_cache"
+os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+
+TRANSCODE_PROFILES = {
+    "audio_16k_mono": {
+        "ext": ".ogg",
+        "args": ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k"],
+    },
+    "video_480p": {
+        "ext": ".mp4",
+        "args": [
+            "-vf", "scale=-2:'min(480,ih)',fps=5",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+            "-ac", "1", "-ar", "16000", "-c:a", "aac", "-b:a", "32k",
+        ],
+    },
+    "video_keyframes": {
+        "ext": ".mp4",
+        "input_args": ["-skip_frame", "nokey"],
+        "args": [
+            "-vf", "scale=-2:'min(480,ih)'", "-fps_mode", "vfr",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+            "-ac", "1", "-ar", "16000", "-c:a", "aac", "-b:a", "32k",
+        ],
+    },
+}
+
+# Profile used per media kind; "off" uploads the original file.
+AUDIO_TRANSCODE_PROFILE = os.getenv("AUDIO_TRANSCODE_PROFILE", "audio_16k_mono")
+VIDEO_TRANSCODE_PROFILE = os.getenv("VIDEO_TRANSCODE_PROFILE", "video_480p")
+
+stats = {"transcodes": 0, "cache_hits": 0, "failures": 0, "bytes_in": 0, "bytes_out": 0, "bytes_saved": 0,
+         "transcode_seconds": 0.0, "upload_seconds_saved": 0.0}
+
+_ffmpeg_missing = False
+
+
+def profile_for(path: str) -> str | None:
+    """Returns the configured transcode profile for a media file, or None to upload it as-is."""
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type and mime_type.startswith("audio/"):
+        profile = AUDIO_TRANSCODE_PROFILE
+    elif mime_type and mime_type.startswith("video/"):
+        profile = VIDEO_TRANSCODE_PROFILE
+    else:
+        return None
+    return profile if profile in TRANSCODE_PROFILES else None
+
+def build_command(profile_name: str, source_path: str, output_path: str) -> list:
+    """Builds the ffmpeg command line for a transcode profile."""
+    profile = TRANSCODE_PROFILES[profile_name]
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        *profile.get("input_args", []), "-i", source_path,
+        *profile["args"], "-y", output_path,
+    ]
+
+
+async def prepare(source_path: str, digest: str, upload_throughput: float = 0.0) -> str:
+    """
+    Returns the path to upload for a media file: a cached or fresh transcode when that is
+    smaller than the source, otherwise the source itself. Never raises; failures fall back
+    to the original file. `upload_throughput` (bytes/s of transfer alone) is used to estimate
+    seconds saved.
+    """
+    global _ffmpeg_missing
+    profile_name = profile_for(source_path)
+    if not profile_name or _ffmpeg_missing:
+        return source_path
+
+    output_path = os.path.join(TRANSCODE_CACHE_DIR, f"{digest}.{profile_name}{TRANSCODE_PROFILES[profile_name]['ext']}")
+    source_size = os.path.getsize(source_path)
+
+    if os.path.exists(output_path):
+        stats["cache_hits"] += 1
+        storage.touch(output_path)
+    else:
+        partial_path = f"{output_path}.part{TRANSCODE_PROFILES[profile_name]['ext']}"
+        started = time.perf_counter()
+        try:
+            with tracing.span("ffprobe"):
+                duration = await ffmpeg_jobs.probe_duration(source_path)
+            await ffmpeg_jobs.run(
+                build_command(profile_name, source_path, partial_path),
+                duration=duration, label=f"Preparing {os.path.basename(source_path)} for analysis",
+            )
+            os.replace(partial_path, output_path)
+        except FileNotFoundError:
+            _ffmpeg_missing = True
+            print("Warning: `ffmpeg` not found. Media will be uploaded without transcoding.", flush=True)
+            return source_path
+        except Exception as e:
+            stats["failures"] += 1
+            print(f"Transcoding {source_path} with {profile_name} failed: {e}", flush=True)
+            return source_path
+        finally:
+            # Also on cancellation: a partial output must not linger in the cache.
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        stats["transcodes"] += 1
+        stats["transcode_seconds"] += time.perf_counter() - started
+        storage.register(output_path)
+
+    output_size = os.path.getsize(output_path)
+    if output_size >= source_size:
+        return source_path
+
+    saved = source_size - output_size
+    stats["bytes_in"] += source_size
+    stats["bytes_out"] += output_size
+    stats["bytes_saved"] += saved
+    if upload_throughput:
+        stats["upload_seconds_saved"] += saved / upload_throughput
+    print(f"Transcoded {source_path} with {profile_name}: {source_size} -> {output_size} bytes.", flush=True)
+    return output_path
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+import hashlib
+from typing import AsyncIterator
+
+import storage
+
+# Content-addressed storage for user uploads.
+# Uploads are streamed to a temporary file while being hashed, then moved to
+# uploads/<shard>/<sha256><ext>. The hash doubles as the stable file id, so uploading the
+# same bytes twice stores them once and returns the same id.
+
+UPLOADS_DIR = "uploads"
+INCOMING_DIR = os.path.join(UPLOADS_DIR, ".incoming")
+INDEX_PATH = os.path.join(UPLOADS_DIR, "index.json")
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOADS_QUOTA_BYTES = int(os.getenv("UPLOADS_QUOTA_BYTES", str(10 * 1024 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+os.makedirs(INCOMING_DIR, exist_ok=True)
+
+FILE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadRejected(Exception):
+    """Raised when an upload violates a size limit or quota."""
+
+    def __init__(self, message: str, status_code: int = 413):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _load_index() -> dict:
+    try:
+        with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+_index = _load_index()
+_index_lock = asyncio.Lock()
+
+def _save_index():
+    tmp_path = f"{INDEX_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_index, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+def _write_chunk(f, digest, chunk: bytes):
+    # Hashing and writing both happen in the worker thread, off the event loop.
+    digest.update(chunk)
+    f.write(chunk)
+
+def stored_bytes() -> int:
+    """Total size of all stored uploads, as recorded in the index."""
+    return sum(record["size"] for record in _index.values())
+
+
+async def save_stream(chunks: AsyncIterator[bytes], filename: str, content_type: str = None, expected_size: int = None) -> dict:
+    """
+    Streams an upload to disk, hashing it on the way, and stores it under its content hash.
+    Returns the upload record, with `deduplicated` set when the bytes were already stored.
+    Raises UploadRejected when the upload is too large or the uploads quota is exhausted.
+    """
+    if expected_size is not None and expected_size > MAX_UPLOAD_BYTES:
+        raise UploadRejected(f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit.")
+
+    _, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    tmp_path = os.path.join(INCOMING_DIR, str(uuid.uuid4()))
+    digest = hashlib.sha256()
+    size = 0
+
+    f = await asyncio.to_thread(open, tmp_path, 'wb')
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadRejected(f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit.")
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, tmp_path)
+        raise
+    await asyncio.to_thread(f.close)
+
+    file_id = digest.hexdigest()
+    async with _index_lock:
+        record = _index.get(file_id)
+        if record and os.path.exists(record["path"]):
+            await asyncio.to_thread(os.remove, tmp_path)
+            return {**record, "deduplicated": True}
+
+        if stored_bytes() + size > UPLOADS_QUOTA_BYTES:
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise UploadRejected("Upload storage quota exhausted.", status_code=507)
+
+        final_path = storage.shard_path(UPLOADS_DIR, f"{file_id}{ext}")
+        await asyncio.to_thread(os.replace, tmp_path, final_path)
+        storage.register(final_path)
+        record = {
+            "file_id": file_id,
+            "filename": filename,
+            "path": final_path,
+            "size": size,
+            "content_type": content_type,
+        }
+        _index[file_id] = record
+        await asyncio.to_thread(_save_index)
+    return {**record, "deduplicated": False}
+
+async def iter_upload_file(upload) -> AsyncIterator[bytes]:
+    """Yields the contents of a FastAPI UploadFile in chunks."""
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def get_upload(file_id: str) -> dict | None:
+    """Returns the record of a stored upload by its file id."""
+    return _index.get(file_id)
+
+def resolve_path(file_ref: str) -> str:
+    """
+    Maps a file id, an upload path or a bare upload filename to a path inside uploads/.
+    Unknown references resolve to their sharded location so callers can report "not found".
+    """
+    file_ref = (file_ref or "").strip()
+    if FILE_ID_PATTERN.match(file_ref) and file_ref in _index:
+        return _index[file_ref]["path"]
+    # Paths returned by /uploads and bare <sha><ext> filenames both carry the file id as their stem.
+    file_id = file_id_for_path(file_ref)
+    if file_id:
+        return _index[file_id]["path"]
+    return storage.shard_path(UPLOADS_DIR, os.path.basename(file_ref))
+
+def file_id_for_path(path: str) -> str | None:
+    """Returns the file id of a stored upload path, without re-reading its bytes."""
+    stem, _ = os.path.splitext(os.path.basename(path or ""))
+    return stem if stem in _index else None
+
+def forget_path(path: str):
+    """Drops the record of an upload whose file was removed (storage eviction hook)."""
+    file_id = file_id_for_path(path)
+    if file_id and os.path.normpath(_index[file_id]["path"]) == os.path.normpath(path):
+        del _index[file_id]
+        _save_index()
+
+storage.eviction_hooks.append(forget_path)
@@ -0,0 +1,68 @@
+import os
+import time
+import asyncio
+import importlib
+
+import models
+import consensus
+import embedding_service
+
+# Startup readiness and optional warmup.
+# Heavy SDKs and the embedding model load lazily on first use. With TIWA_WARMUP=1 they are
+# loaded in the background right after startup instead, and /readyz reports 503 until
+# that finishes, so a load balancer only sends traffic to warm workers.
+
+TIWA_WARMUP = os.getenv("TIWA_WARMUP", "0") == "1"
+
+# Libraries only some tools need; importing them here keeps the first tool call fast.
+WARMUP_MODULES = ["replicate", "tavily", "bs4", "pypdf"]
+
+state = {"started": False, "warmup": "enabled" if TIWA_WARMUP else "disabled", "components": {}}
+
+
+def _import_modules():
+    for name in WARMUP_MODULES:
+        importlib.import_module(name)
+
+def _load_similarity_model():
+    # One encode initializes torch kernels as well as the weights.
+    consensus.get_similarity_model().encode(["warmup"], convert_to_numpy=True)
+
+async def _warm_embeddings():
+    if embedding_service.EMBEDDING_SOCKET:
+        # The sidecar holds the model; this only opens the connection and checks it answers.
+        await embedding_service.encode(["warmup"])
+    else:
+        await asyncio.to_thread(_load_similarity_model)
+
+async def _warm(name: str, coro):
+    started = time.perf_counter()
+    try:
+        await coro
+        state["components"][name] = {"status": "ready", "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        # Warmup is best effort; the component still loads lazily when first used.
+        state["components"][name] = {"status": "failed", "error": str(e)}
+        print(f"Warmup of {name} failed: {e}", flush=True)
+
+async def run_warmup():
+    """Loads the Gemini SDK and models, the embedding model and tool libraries concurrently."""
+    state["warmup"] = "running"
+    started = time.perf_counter()
+    await asyncio.gather(
+        _warm("gemini", asyncio.gather(models.get_tool_decider_model(), models.get_judge_model())),
+        _warm("similarity_model", _warm_embeddings()),
+        _warm("tool_libraries", asyncio.to_thread(_import_modules)),
+    )
+    state["warmup"] = "done"
+    print(f"Warmup finished in {time.perf_counter() - started:.1f}s.", flush=True)
+
+def start():
+    """Marks the app as started and launches the background warmup when enabled."""
+    state["started"] = True
+    if TIWA_WARMUP:
+        return asyncio.create_task(run_warmup())
+    return None
+
+def is_ready() -> bool:
+    return state["started"] and state["warmup"] in ("disabled", "done")
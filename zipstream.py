@@ -0,0 +1,146 @@
+import os
+import time
+import zlib
+import struct
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+
+# Streaming ZIP writer. Archives are produced as a sequence of byte chunks so they can be
+# sent straight to an HTTP response without a temporary file. Each entry is compressed on
+# its own, which lets several files be deflated in parallel (zlib releases the GIL).
+
+# Already-compressed formats are stored as-is; deflating them costs CPU and saves nothing.
+STORE_ONLY_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.mp4', '.mov', '.mkv', '.webm', '.mp3', '.aac', '.ogg', '.opus', '.flac',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.woff', '.woff2', '.pdf',
+}
+
+ZIP_COMPRESSION_LEVEL = int(os.getenv("ZIP_COMPRESSION_LEVEL", "6"))
+# Number of threads compressing entries concurrently. 1 compresses files one after another.
+ZIP_COMPRESSION_WORKERS = int(os.getenv("ZIP_COMPRESSION_WORKERS", "1"))
+# When set, every entry is stored without compression.
+ZIP_STORE_ONLY = os.getenv("ZIP_STORE_ONLY", "0") == "1"
+
+_STORED, _DEFLATED = 0, 8
+_UTF8_FLAG = 0x800
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+
+def _dos_datetime(timestamp: float) -> tuple:
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _list_files(directory: str) -> list:
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            entries.append((file_path, os.path.relpath(file_path, start=directory).replace(os.sep, "/")))
+    return entries
+
+def _compress_entry(file_path: str, store_only: bool, level: int) -> tuple:
+    """Reads one file and returns (method, crc32, raw_size, payload, stat)."""
+    st = os.stat(file_path)
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+
+    _, ext = os.path.splitext(file_path)
+    if store_only or ext.lower() in STORE_ONLY_EXTENSIONS:
+        return _STORED, zlib.crc32(raw), len(raw), raw, st
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(raw) + compressor.flush()
+    if len(payload) >= len(raw):
+        return _STORED, zlib.crc32(raw), len(raw), raw, st
+    return _DEFLATED, zlib.crc32(raw), len(raw), payload, st
+
+def _iter_compressed(entries: list, store_only: bool, level: int, workers: int) -> Iterator[tuple]:
+    """Yields compressed entries in order, keeping at most 2 * workers files in memory."""
+    if workers <= 1:
+        for file_path, arcname in entries:
+            yield arcname, _compress_entry(file_path, store_only, level)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip") as pool:
+        pending = []
+        for file_path, arcname in entries:
+            pending.append((arcname, pool.submit(_compress_entry, file_path, store_only, level)))
+            if len(pending) >= workers * 2:
+                name, future = pending.pop(0)
+                yield name, future.result()
+        for name, future in pending:
+            yield name, future.result()
+
+
+def iter_zip(directory: str, store_only: bool = None, workers: int = None, level: int = None) -> Iterator[bytes]:
+    """
+    Yields the bytes of a ZIP archive of `directory`, one entry at a time.
+    This is a blocking generator; use `stream_zip` from async code.
+    """
+    store_only = ZIP_STORE_ONLY if store_only is None else store_only
+    workers = ZIP_COMPRESSION_WORKERS if workers is None else workers
+    level = ZIP_COMPRESSION_LEVEL if level is None else level
+
+    offset = 0
+    central_directory = []
+
+    for arcname, (method, crc, raw_size, payload, st) in _iter_compressed(_list_files(directory), store_only, level, workers):
+        if offset > _ZIP32_LIMIT or raw_size > _ZIP32_LIMIT:
+            raise ValueError("Archive exceeds the 4 GiB ZIP32 limit.")
+
+        name = arcname.encode("utf-8")
+        dos_time, dos_date = _dos_datetime(st.st_mtime)
+        local_header = struct.pack(
+            "<4s2B4HL2L2H", b"PK\x03\x04", 20, 0, _UTF8_FLAG, method, dos_time, dos_date,
+            crc, len(payload), raw_size, len(name), 0,
+        )
+        central_directory.append(struct.pack(
+            "<4s4B4HL2L5H2L", b"PK\x01\x02", 20, 3, 20, 0, _UTF8_FLAG, method, dos_time, dos_date,
+            crc, len(payload), raw_size, len(name), 0, 0, 0, 0, (st.st_mode & 0xFFFF) << 16, offset,
+        ) + name)
+
+        yield local_header + name
+        yield payload
+        offset += len(local_header) + len(name) + len(payload)
+
+    central_bytes = b"".join(central_directory)
+    if offset > _ZIP32_LIMIT or len(central_directory) > 0xFFFF:
+        raise ValueError("Archive exceeds the ZIP32 limits.")
+    yield central_bytes + struct.pack(
+        "<4s4H2LH", b"PK\x05\x06", 0, 0, len(central_directory), len(central_directory),
+        len(central_bytes), offset, 0,
+    )
+
+def write_zip(directory: str, output_path: str, **options) -> int:
+    """Writes a ZIP archive of `directory` to `output_path` and returns its size in bytes."""
+    size = 0
+    with open(output_path, 'wb') as f:
+        for chunk in iter_zip(directory, **options):
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+async def stream_zip(directory: str, **options) -> AsyncIterator[bytes]:
+    """Async wrapper around `iter_zip` that generates each chunk in a worker thread."""
+    chunks = iter_zip(directory, **options)
+    done = object()
+    # One dedicated thread runs both `next` and `close`: after a cancellation the pending `next`
+    # may still be executing, and closing the generator from another thread would fail with
+    # "generator already executing". Queued behind it, `close` runs once `next` returns.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zip-stream")
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        try:
+            await loop.run_in_executor(executor, chunks.close)
+        finally:
+            executor.shutdown(wait=False)